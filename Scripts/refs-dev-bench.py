@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+End-to-end crawl/index throughput benchmark
+Runs the full RefsDevCrawler → CloudflareVectorIndexer path against the local
+synthetic doc site and Workers stub, and records pages/s, chunks/s, upload
+MB/s, peak RSS, p50/p99 stage latencies and the crawler's cold-start import
+time and RSS as JSON that can be compared across commits:
+
+    python Scripts/refs-dev-bench.py --pages 2000 --runs 3 --output bench.json
+    python Scripts/refs-dev-bench.py --pages 2000 --baseline bench.json
+"""
+
+import os
+import sys
+import json
+import socket
+import logging
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import multiprocessing
+import importlib.util
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Metrics compared against a baseline, and whether bigger is better
+TRACKED_METRICS = {
+    "pages_per_sec": True,
+    "chunks_per_sec": True,
+    "upload_mb_per_sec": True,
+    "peak_rss_mb": False,
+    "cold_start_s": False,
+    "import_rss_mb": False,
+}
+
+# Run in a fresh interpreter: time to import the crawler and the RSS it leaves
+COLD_START_PROBE = """
+import json, resource, sys, time, importlib.util
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("refs_dev_crawler", sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3)
+print(json.dumps({"import_s": elapsed, "rss_mb": rss, "modules": len(sys.modules)}))
+"""
+
+
+def _load_sibling(filename: str, name: str):
+    """Import a hyphen-named script that lives next to this one"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # so its functions pickle by reference, e.g. into worker processes
+    spec.loader.exec_module(module)
+    return module
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_fixtures(site_options: Dict[str, Any], stub_options: Dict[str, Any], site_port: int, stub_port: int, ready) -> None:
+    """Child process: serve the doc site and the Workers stub until terminated"""
+    logging.disable(logging.CRITICAL)
+    docsite = _load_sibling("refs-dev-docsite.py", "refs_dev_docsite")
+    stub_module = _load_sibling("refs-dev-workers-stub.py", "refs_dev_workers_stub")
+
+    async def serve() -> None:
+        site = docsite.DocSite(docsite.SiteConfig(**site_options["site"]))
+        server = docsite.DocSiteServer(site, docsite.LatencyModel.parse(site_options["latency"]), seed=site.config.seed)
+        stub = stub_module.WorkersStub(stub_module.StubConfig(
+            latency=stub_module.LatencyModel.parse(stub_options["latency"]),
+            rate_429=stub_options["rate_429"],
+            rate_5xx=stub_options["rate_5xx"],
+            retry_after=stub_options["retry_after"],
+            seed=site.config.seed,
+        ))
+        await server.start(port=site_port)
+        await stub.start(port=stub_port)
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def run_crawl(settings: Dict[str, Any], results) -> None:
+    """Child process: one measured crawl, so peak RSS belongs to this run alone"""
+    crawler = _load_sibling("refs-dev-crawler.py", "refs_dev_crawler")
+    logging.getLogger().setLevel(logging.WARNING)
+    crawler.UPLOAD_BACKOFF_BASE = settings["backoff_base"]
+
+    async def crawl() -> Dict[str, Any]:
+        # Before the indexer's session and the state database are opened
+        parse_pool = None
+        if settings["parse_workers"] > 0:
+            parse_pool = crawler.ParsePool(settings["parse_workers"], crawler.RecursiveTextSplitter())
+        indexer = crawler.CloudflareVectorIndexer(
+            account_id="benchmark",
+            api_token="",
+            index_name="benchmark",
+            upload_concurrency=settings["upload_concurrency"],
+            compress=settings["gzip"],
+            shared_metadata=settings["shared_metadata"],
+        )
+        indexer.workers_url = settings["workers_url"]
+        state = crawler.CrawlStateStore(settings["state_db"])
+        fetcher = crawler.AsyncFetcher(
+            concurrency=settings["fetch_concurrency"],
+            per_host=settings["fetch_per_host"],
+        )
+        try:
+            async with indexer:
+                return await crawler.RefsDevCrawler(
+                    indexer,
+                    fetcher=fetcher,
+                    max_depth=settings["max_depth"],
+                    max_pages=settings["max_pages"],
+                    state=state,
+                    sources={"synthetic": [settings["seed_url"]]},
+                    parse_pool=parse_pool,
+                ).crawl_all_sources()
+        finally:
+            state.close()
+            if parse_pool is not None:
+                parse_pool.close()
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    stats = asyncio.run(crawl())
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    indexing = stats["indexing"]
+    upload_mb = indexing["bytes_sent"] / 1e6
+    results.put({
+        "wall_s": round(elapsed, 3),
+        "cpu_s": round(cpu, 3),
+        "pages": stats["total_pages"],
+        "chunks": stats["total_chunks"],
+        "indexed": indexing["success"],
+        "failed": indexing["failed"],
+        "retries": indexing["retries"],
+        "batches": indexing["batches"],
+        "upload_mb": round(upload_mb, 3),
+        "pages_per_sec": round(stats["total_pages"] / elapsed, 2),
+        "chunks_per_sec": round(stats["total_chunks"] / elapsed, 2),
+        "upload_mb_per_sec": round(upload_mb / elapsed, 3),
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3), 1
+        ),
+        "time_to_first_index_s": stats["time_to_first_index"],
+        "stages": stats["stages"],
+    })
+
+
+def measure_cold_start(runs: int) -> Dict[str, Any]:
+    """Median import time and resident memory of the crawler module in fresh interpreters"""
+    probes = [
+        json.loads(subprocess.run(
+            [sys.executable, "-c", COLD_START_PROBE, os.path.join(SCRIPTS_DIR, "refs-dev-crawler.py")],
+            capture_output=True, text=True, check=True
+        ).stdout)
+        for _ in range(runs)
+    ]
+    return {
+        "cold_start_s": round(statistics.median(probe["import_s"] for probe in probes), 3),
+        "import_rss_mb": round(statistics.median(probe["rss_mb"] for probe in probes), 1),
+        "modules_loaded": probes[0]["modules"],
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Median of every numeric metric across runs, stage percentiles included"""
+    summary = {}
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values = [run[key] for run in runs if run.get(key) is not None]
+            summary[key] = round(statistics.median(values), 3) if values else None
+    summary["stages"] = {
+        stage: {
+            metric: round(statistics.median(run["stages"][stage][metric] for run in runs if stage in run["stages"]), 3)
+            for metric in ("p50_ms", "p99_ms")
+        }
+        for stage in runs[0]["stages"]
+    }
+    return summary
+
+
+def compare(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Describe every tracked metric that regressed by more than tolerance"""
+    regressions = []
+    for metric, higher_is_better in TRACKED_METRICS.items():
+        current, previous = summary.get(metric), baseline.get("summary", {}).get(metric)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{metric}: {previous} → {current} ({change:+.1%})")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    docsite = _load_sibling("refs-dev-docsite.py", "refs_dev_docsite")
+    parser = argparse.ArgumentParser(description="Benchmark the crawl → index pipeline against local stand-ins")
+    docsite.add_site_arguments(parser)
+    parser.set_defaults(pages=2000)
+    parser.add_argument("--runs", type=int, default=3, help="measured runs; the summary is their median")
+    parser.add_argument("--site-latency", default="uniform:0.005,0.03", help="doc site latency distribution")
+    parser.add_argument("--workers-latency", default="lognormal:0.05,0.4", help="Workers stub latency distribution")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of uploads throttled by the stub")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="share of uploads failing with a 5xx")
+    parser.add_argument("--fetch-concurrency", type=int, default=32)
+    parser.add_argument("--fetch-per-host", type=int, default=32)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=0, help="extract/split worker processes (default: inline)")
+    parser.add_argument("--gzip-uploads", action="store_true")
+    parser.add_argument("--shared-metadata", action="store_true")
+    parser.add_argument("--cold-start-runs", type=int, default=5, help="fresh interpreters timed importing the crawler")
+    parser.add_argument("--label", help="free-form tag stored with the results")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression before failing (default: 0.10)")
+    args = parser.parse_args(argv)
+    args.site_config = docsite.site_config_from_args(args)
+    args.max_depth = docsite.depth_for(args.site_config)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    context = multiprocessing.get_context("spawn")
+    site_port, stub_port = _free_port(), _free_port()
+
+    ready = context.Event()
+    fixtures = context.Process(
+        target=serve_fixtures,
+        args=(
+            {"site": vars(args.site_config), "latency": args.site_latency},
+            {"latency": args.workers_latency, "rate_429": args.rate_429, "rate_5xx": args.rate_5xx, "retry_after": 0.1},
+            site_port,
+            stub_port,
+            ready,
+        ),
+        daemon=True,
+    )
+    fixtures.start()
+    if not ready.wait(60):
+        print("❌ Fixture servers did not start")
+        return 1
+
+    cold_start = measure_cold_start(args.cold_start_runs)
+    print(
+        f"🧊 Cold start: {cold_start['cold_start_s']} s, {cold_start['import_rss_mb']} MB RSS, "
+        f"{cold_start['modules_loaded']} modules",
+        file=sys.stderr
+    )
+    print(f"🏁 Benchmarking {args.pages} pages × {args.runs} runs", file=sys.stderr)
+    runs = []
+    try:
+        for number in range(1, args.runs + 1):
+            with tempfile.TemporaryDirectory() as workdir:
+                settings = {
+                    "seed_url": f"http://127.0.0.1:{site_port}/docs/",
+                    "workers_url": f"http://127.0.0.1:{stub_port}",
+                    "state_db": os.path.join(workdir, "state.db"),
+                    "max_depth": args.max_depth,
+                    "max_pages": args.pages + 1,
+                    "fetch_concurrency": args.fetch_concurrency,
+                    "fetch_per_host": args.fetch_per_host,
+                    "upload_concurrency": args.upload_concurrency,
+                    "parse_workers": args.parse_workers,
+                    "gzip": args.gzip_uploads,
+                    "shared_metadata": args.shared_metadata,
+                    "backoff_base": 0.05,
+                }
+                queue = context.Queue()
+                worker = context.Process(target=run_crawl, args=(settings, queue))
+                worker.start()
+                run = queue.get()
+                worker.join()
+            runs.append(run)
+            print(
+                f"  run {number}: {run['pages_per_sec']} pages/s, {run['chunks_per_sec']} chunks/s, "
+                f"{run['upload_mb_per_sec']} MB/s, peak RSS {run['peak_rss_mb']} MB",
+                file=sys.stderr
+            )
+    finally:
+        fixtures.terminate()
+
+    results = {
+        "benchmark": "crawl-index-e2e",
+        "label": args.label,
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "site": vars(args.site_config),
+            "site_latency": args.site_latency,
+            "workers_latency": args.workers_latency,
+            "rate_429": args.rate_429,
+            "rate_5xx": args.rate_5xx,
+            "fetch_concurrency": args.fetch_concurrency,
+            "fetch_per_host": args.fetch_per_host,
+            "upload_concurrency": args.upload_concurrency,
+            "parse_workers": args.parse_workers,
+            "gzip_uploads": args.gzip_uploads,
+            "shared_metadata": args.shared_metadata,
+        },
+        "runs": runs,
+        "summary": {**summarize(runs), **cold_start},
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"💾 Results saved to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results["summary"], json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ Regressions beyond {args.tolerance:.0%}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"    - {regression}", file=sys.stderr)
+            return 1
+        print("✅ No regressions against the baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
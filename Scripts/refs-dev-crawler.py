@@ -9,20 +9,39 @@ import sys
 import json
 import logging
 import asyncio
-from typing import List, Dict, Any
+import argparse
+import sqlite3
+import time
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, Iterator, AsyncIterable, AsyncIterator, Union, NamedTuple, TYPE_CHECKING
 from datetime import datetime
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit, urlunsplit, urljoin, urldefrag, parse_qsl, urlencode
+import glob
+import gzip
+import array
+import bisect
+import codecs
+import contextlib
+import dataclasses
+import functools
 import hashlib
+import importlib
+import io
+import math
+import operator
+import random
+import re
+import threading
+import tracemalloc
+from concurrent.futures import BrokenExecutor
+from email.utils import parsedate_to_datetime
 
-# Required packages
-try:
-    import requests
-    from langchain_community.document_loaders import WebBaseLoader
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
+# Third-party packages are imported on first use (see require and optional)
+# so that a search or a --help does not pay for the crawl stack; langchain is
+# only needed to hand out Documents
+if TYPE_CHECKING:
+    import aiohttp
     from langchain.schema import Document
-except ImportError as e:
-    print(f"Error: Missing required package - {e}")
-    print("Install with: pip install requests langchain langchain-community")
-    sys.exit(1)
 
 # Configure logging
 logging.basicConfig(
@@ -37,6 +56,142 @@ CLOUDFLARE_API_TOKEN = os.getenv("CLOUDFLARE_API_TOKEN", "")
 VECTORIZE_INDEX = "mca-embeddings"
 WORKERS_URL = os.getenv("WORKERS_URL", "https://agents-starter.wmeldman33.workers.dev")
 
+# Fetch engine limits
+FETCH_CONCURRENCY = int(os.getenv("CRAWLER_FETCH_CONCURRENCY", "32"))
+FETCH_PER_HOST_CONCURRENCY = int(os.getenv("CRAWLER_FETCH_PER_HOST", "4"))
+FETCH_TIMEOUT = float(os.getenv("CRAWLER_FETCH_TIMEOUT", "30"))
+USER_AGENT = os.getenv("USER_AGENT", "MyCodeAssistant-RefsDevCrawler/1.0")
+
+# Crawl frontier limits
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWLER_MAX_DEPTH", "3"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWLER_MAX_PAGES", "5000"))
+
+# Links to these file types never lead to indexable documentation
+SKIPPED_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp",
+    ".pdf", ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".dmg", ".pkg",
+    ".css", ".js", ".json", ".xml", ".txt", ".mp4", ".mp3", ".woff", ".woff2",
+)
+# Crawl state for resumable runs
+CRAWL_STATE_DB = os.getenv("CRAWLER_STATE_DB", "crawler_state.db")
+INDEX_SLICE_SIZE = 500
+
+# Pipeline queue bounds; a full queue pauses the stages feeding it
+PIPELINE_PAGE_QUEUE = int(os.getenv("CRAWLER_PAGE_QUEUE", "16"))
+PIPELINE_CHUNK_QUEUE = int(os.getenv("CRAWLER_CHUNK_QUEUE", "512"))
+
+# Extract + split in worker processes (0 keeps them on the event loop). Where
+# workers are forked, page bodies and extracted text cross the process
+# boundary through shared-memory slots of this size instead of a pipe
+PARSE_WORKERS = int(os.getenv("CRAWLER_PARSE_WORKERS", "0"))
+PARSE_SLOT_BYTES = 4 * 1024 * 1024
+
+# Upload client limits
+UPLOAD_CONCURRENCY = int(os.getenv("CRAWLER_UPLOAD_CONCURRENCY", "4"))
+UPLOAD_TIMEOUT = float(os.getenv("CRAWLER_UPLOAD_TIMEOUT", "30"))
+
+# Adaptive batch sizing bounds and the latency the policy steers towards
+BATCH_MIN_DOCS = 1
+BATCH_MAX_DOCS = int(os.getenv("CRAWLER_BATCH_MAX_DOCS", "100"))
+BATCH_MIN_BYTES = 16 * 1024
+BATCH_MAX_BYTES = int(os.getenv("CRAWLER_BATCH_MAX_BYTES", str(2 * 1024 * 1024)))
+BATCH_TARGET_LATENCY = float(os.getenv("CRAWLER_BATCH_TARGET_LATENCY", "2.0"))
+BATCH_LINGER = 0.5
+# Already-indexed chunks are reported to on_batch in groups of this many IDs
+BATCH_SKIP_REPORT = 500
+
+# Request body encoding: hard cap on a single request and opt-in gzip, which
+# the Worker must decode (embeddings.ts does for Content-Encoding: gzip)
+UPLOAD_MAX_BODY_BYTES = int(os.getenv("CRAWLER_UPLOAD_MAX_BODY_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_GZIP = os.getenv("CRAWLER_UPLOAD_GZIP", "").lower() in ("1", "true", "yes")
+UPLOAD_GZIP_LEVEL = 5
+UPLOAD_GZIP_MIN_BYTES = 1024
+
+# Metadata payloads: "shared" sends each page's metadata once per batch with
+# per-chunk deltas (the Worker expands it); every stored metadata object is
+# capped so it fits Workers KV's 1 KiB metadata limit with the Worker's own fields
+UPLOAD_SHARED_METADATA = os.getenv("CRAWLER_UPLOAD_SHARED_METADATA", "").lower() in ("1", "true", "yes")
+METADATA_MAX_BYTES = int(os.getenv("CRAWLER_METADATA_MAX_BYTES", "768"))
+CHUNK_METADATA_KEYS = ("chunk_index", "start_index")
+
+# Upload retry policy
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("CRAWLER_UPLOAD_MAX_ATTEMPTS", "5"))
+UPLOAD_BACKOFF_BASE = 0.5
+UPLOAD_BACKOFF_CAP = 30.0
+RETRY_AFTER_CAP = 120.0
+
+# Failed batches are kept here for replay; a .zst suffix stores zstd frames
+DEAD_LETTER_PATH = os.getenv("CRAWLER_DEAD_LETTER_PATH", "crawler_deadletter.jsonl")
+DELETE_BATCH_SIZE = 100
+
+# Latency samples kept per pipeline stage for percentiles
+STAGE_TIMING_RESERVOIR = 10000
+
+# Telemetry: histogram buckets, an optional Prometheus port and span file
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+BATCH_BYTES_BUCKETS = (16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6)
+METRICS_PORT = int(os.getenv("CRAWLER_METRICS_PORT", "0")) or None
+TRACE_PATH = os.getenv("CRAWLER_TRACE_PATH") or None
+
+# --profile: stack sampling period, and output written next to the stats file
+PROFILE_INTERVAL = float(os.getenv("CRAWLER_PROFILE_INTERVAL", "0.005"))
+PROFILE_MEMORY_TOP = 15
+PROFILE_FOLDED_FILE = "crawler_profile.folded"
+PROFILE_MEMORY_FILE = "crawler_profile_memory.json"
+
+# HTML extraction. A charset not given by Content-Type is taken from a BOM or
+# a <meta> in the first KiB, as browsers do, instead of sniffing the body
+META_CHARSET_SCAN_BYTES = 1024
+META_CHARSET = re.compile(rb"""<meta[^>]+?charset\s*=\s*["']?\s*([a-zA-Z0-9_:.-]+)""", re.IGNORECASE)
+
+# Only a page's main content is indexed: the first of these XPaths that
+# matches wins, per documentation host, then the generic ones, then <body>
+_HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+MAIN_CONTENT_XPATHS = {
+    "developer.apple.com": ["//main", "//*[@id='main']"],
+    "docs.swift.org": ["//main", "//*[@role='main']"],
+    "www.swift.org": ["//main", "//article"],
+    "docs.python.org": ["//div[@role='main']", f"//div[{_HAS_CLASS.format('body')}]"],
+    "developers.cloudflare.com": [f"//div[{_HAS_CLASS.format('sl-markdown-content')}]", "//main"],
+    "python.langchain.com": [f"//article//div[{_HAS_CLASS.format('markdown')}]", "//article", "//main"],
+}
+GENERIC_MAIN_CONTENT_XPATHS = ["//main", "//article", "//*[@role='main']"]
+# Chrome inside the main content that is never worth embedding
+BOILERPLATE_XPATHS = {
+    "docs.python.org": [f"//a[{_HAS_CLASS.format('headerlink')}]"],
+    "developers.cloudflare.com": [f"//*[{_HAS_CLASS.format('sl-anchor-link')}]"],
+    "python.langchain.com": [
+        f"//*[{_HAS_CLASS.format(name)}]"
+        for name in ("theme-doc-breadcrumbs", "theme-doc-toc-mobile", "pagination-nav", "theme-doc-footer")
+    ],
+}
+BOILERPLATE_TAGS = {
+    "script", "style", "noscript", "template", "svg", "iframe",
+    "nav", "header", "footer", "aside", "form", "button", "select",
+}
+# Page chrome at the top level, but the page's own title and byline inside these
+SECTION_CHROME_TAGS = {"header", "footer"}
+SECTIONING_TAGS = {"article", "main"}
+# Text emitted after a block element closes, so the splitter can cut on structure
+BLOCK_BREAKS = {
+    **dict.fromkeys(("p", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "table", "blockquote", "figure", "hr", "section"), "\n\n"),
+    **dict.fromkeys(("div", "li", "ul", "ol", "dl", "dt", "dd", "tr", "br", "caption", "figcaption"), "\n"),
+    **dict.fromkeys(("td", "th"), " "),
+}
+BLOCK_STARTS = {tag for tag, text in BLOCK_BREAKS.items() if "\n" in text} - {"br", "hr"}
+# Runs a browser would render as one space; a lone space is left alone, which
+# keeps the common case match-free
+WHITESPACE_RUN = re.compile(r"[ \t\r\n\f\v]{2,}|[\t\r\n\f\v]")
+EXCESS_NEWLINES = re.compile(r"\n{3,}")
+# Chunks' worth of text the streaming splitter takes in at a time
+STREAM_FEED_CHUNKS = 4
+# Characters of extracted text gathered into each fragment handed on while walking a page
+TEXT_FRAGMENT_CHARS = 1024
+
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = {"ref", "fbclid", "gclid"}
+
 # Documentation sources
 DOCUMENTATION_SOURCES = {
     "swift": [
@@ -61,187 +216,2769 @@ DOCUMENTATION_SOURCES = {
     ]
 }
 
+# Packages imported lazily by require, with the distribution that provides them
+REQUIRED_PACKAGES = {
+    "aiohttp": "aiohttp",
+    "lxml.html": "lxml",
+    "lxml.etree": "lxml",
+    "langchain.schema": "langchain",
+    "zstandard": "zstandard",
+}
+
+
+def require(module: str):
+    """Import a third-party module on first use, naming the package to install if it is missing"""
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise RuntimeError(f"{module} is required: pip install {REQUIRED_PACKAGES.get(module, module)}") from e
+
+
+@functools.lru_cache(maxsize=None)
+def optional(module: str):
+    """Import an optional accelerator on first use, or None if it is not installed"""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        return None
+
+
+def http_request(url: str, payload: Optional[Any] = None, timeout: float = 10) -> Tuple[int, bytes]:
+    """One blocking JSON request for the calls made outside the async pipeline.
+
+    Uses urllib so a search does not import an HTTP client stack; returns the
+    status and body, with HTTP errors reported as their status.
+    """
+    import urllib.request
+    import urllib.error
+    request = urllib.request.Request(
+        url,
+        data=dumps_json(payload) if payload is not None else None,
+        headers={"Content-Type": "application/json", "User-Agent": USER_AGENT},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Canonicalize a URL for deduplication, or return None if it is not crawlable.
+
+    Resolves relative links against ``base``, lowercases scheme and host, drops
+    default ports, fragments, trailing slashes and tracking parameters, and
+    sorts the remaining query parameters.
+    """
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    
+    host = parts.hostname.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    if port and not (scheme == "http" and port == 80) and not (scheme == "https" and port == 443):
+        host = f"{host}:{port}"
+    
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    if path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    
+    query = urlencode(sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_in_scope(url: str, scope: str) -> bool:
+    """Whether a normalized URL lives under a normalized scope prefix"""
+    if url == scope:
+        return True
+    scope_parts = urlsplit(scope)
+    url_parts = urlsplit(url)
+    if url_parts.scheme != scope_parts.scheme or url_parts.netloc != scope_parts.netloc:
+        return False
+    prefix = scope_parts.path.rstrip("/")
+    return url_parts.path == prefix or url_parts.path.startswith(prefix + "/")
+
+
+@dataclass
+class FrontierEntry:
+    """A page waiting to be crawled; ``key`` is its normalized dedup form"""
+    url: str
+    key: str
+    language: str
+    depth: int
+    scope: str
+
+
+class CrawlFrontier:
+    """Breadth-first crawl frontier seeded from DOCUMENTATION_SOURCES.
+
+    Every URL is normalized before it is admitted so each page is fetched at
+    most once; the seen set makes that check O(1). Links are only followed
+    while they stay under the prefix of the seed they were discovered from and
+    within the depth and page budgets.
+    """
+
+    def __init__(self, max_depth: int = CRAWL_MAX_DEPTH, max_pages: int = CRAWL_MAX_PAGES):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.scheduled = 0
+        self._seen: set = set()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def add_seed(self, url: str, language: str) -> Optional[FrontierEntry]:
+        """Schedule a seed URL; its normalized form becomes the crawl scope"""
+        scope = normalize_url(url)
+        if scope is None:
+            logger.warning(f"Ignoring uncrawlable seed URL: {url}")
+            return None
+        return self.add(url, language, 0, scope)
+
+    def add(self, url: str, language: str, depth: int, scope: str) -> Optional[FrontierEntry]:
+        """Schedule a discovered URL if it is new, in scope and within budget"""
+        if depth > self.max_depth or self.scheduled >= self.max_pages:
+            return None
+        key = normalize_url(url)
+        if key is None or key in self._seen or not url_in_scope(key, scope):
+            return None
+        self._seen.add(key)
+        self.scheduled += 1
+        # Fetch the URL as linked (minus fragment); servers may treat a
+        # trailing slash differently even though it dedups as the same page
+        entry = FrontierEntry(urldefrag(url)[0], key, language, depth, scope)
+        self._queue.put_nowait(entry)
+        return entry
+
+    def restore(self, seen_keys: Iterable[str], pending: Iterable[FrontierEntry]) -> None:
+        """Reload a persisted frontier: every key counts as seen, pending entries are requeued"""
+        self._seen.update(seen_keys)
+        self.scheduled = len(self._seen)
+        for entry in pending:
+            self._queue.put_nowait(entry)
+
+    def mark_seen(self, url: str) -> bool:
+        """Record a URL reached by redirect; returns False if it was already seen"""
+        normalized = normalize_url(url)
+        if normalized is None or normalized in self._seen:
+            return False
+        self._seen.add(normalized)
+        return True
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def get(self) -> FrontierEntry:
+        return await self._queue.get()
+
+    def task_done(self) -> None:
+        self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys.
+
+    Uses double hashing of a single blake2b digest to derive the ``k`` bit
+    positions, which is plenty for hex chunk IDs.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RecursiveTextSplitter:
+    """Dependency-free port of langchain's RecursiveCharacterTextSplitter.
+
+    Covers the configuration the crawler uses (literal separators kept at
+    the start of the piece that follows them, whitespace stripped, length
+    counted in characters) and produces the same chunks without importing
+    langchain.
+
+    Works on offsets into the text rather than on copied pieces: the pieces
+    of one split are contiguous, so they are held as a list of boundaries,
+    a run of them is merged by arithmetic on those boundaries, and each
+    chunk is one slice of the original text. ``split_spans`` returns the
+    offsets alone, without slicing anything.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, separators: Optional[List[str]] = None):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or ["\n\n", "\n", " ", ""]
+        self._patterns = {separator: re.compile(re.escape(separator)) for separator in self.separators if separator}
+
+    def split_text(self, text: str) -> List[str]:
+        spans = self.split_spans(text)
+        return [text[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2)]
+
+    def split_spans(self, text: str) -> "array.array":
+        """Offsets of each chunk in text, as flat start/end pairs"""
+        spans = array.array("q")
+        self._split(text, 0, len(text), self.separators, spans)
+        return spans
+
+    def iter_split(self, fragments: Iterable[str]) -> Iterator[str]:
+        """The chunks of "".join(fragments), each yielded as soon as it is final.
+
+        Only the chunk being assembled and the text that may still join it
+        are held, so memory is bounded by chunk_size rather than by the length
+        of the text. Fragments are handed on a few chunks' worth at a time,
+        which keeps the per-feed overhead well below the splitting itself.
+        """
+        stream = _SplitStream(self, self.separators)
+        pending: List[str] = []
+        pending_chars = 0
+        for fragment in fragments:
+            pending.append(fragment)
+            pending_chars += len(fragment)
+            if pending_chars >= STREAM_FEED_CHUNKS * self.chunk_size:
+                yield from stream.feed("".join(pending))
+                pending.clear()
+                pending_chars = 0
+        yield from stream.feed("".join(pending))
+        yield from stream.close()
+
+    def _split(self, text: str, start: int, end: int, separators: List[str], spans: "array.array") -> None:
+        """Split text[start:end] on the first separator present, recursing into pieces that are still too long"""
+        separator, remaining = separators[-1], []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) >= 0:
+                separator, remaining = candidate, separators[i + 1:]
+                break
+
+        self._pieces(text, self._boundaries(text, start, end, separator), remaining, spans)
+
+    def _pieces(self, text: str, bounds: List[int], remaining: List[str], spans: "array.array", close: bool = True) -> int:
+        """Merge runs of fitting pieces and split the pieces that are too long.
+
+        Without close the last run's window is left open, for more pieces to
+        join it; returns the piece the window starts at.
+        """
+        last = len(bounds) - 1
+        lengths = map(operator.sub, bounds[1:], bounds)
+        too_long = [i for i, length in enumerate(lengths) if length >= self.chunk_size]
+        first = 0  # the run of fitting pieces is bounds[first] .. bounds[i]
+        for i in too_long:
+            if first < i:
+                self._merge(text, bounds, first, i, spans)
+            if remaining:
+                self._split(text, bounds[i], bounds[i + 1], remaining, spans)
+            else:
+                spans.extend((bounds[i], bounds[i + 1]))
+            first = i + 1
+        if first < last:
+            return self._merge(text, bounds, first, last, spans, close)
+        return first
+
+    def _boundaries(self, text: str, start: int, end: int, separator: str) -> List[int]:
+        """Where each non-empty piece of text[start:end] begins, then end; separators start the piece after them"""
+        if not separator:
+            return list(range(start, end + 1))
+        bounds = [start]
+        bounds.extend([match.start() for match in self._patterns[separator].finditer(text, start, end)])
+        if len(bounds) > 1 and bounds[1] == start:
+            del bounds[1]
+        bounds.append(end)
+        return bounds
+
+    def _merge(self, text: str, bounds: List[int], first: int, last: int, spans: "array.array", close: bool = True) -> int:
+        """Pack pieces first..last into chunks of up to chunk_size, carrying up to chunk_overlap into the next.
+
+        The window is always text[bounds[head]:bounds[i]], so where it next
+        overflows and how far its head must then advance are both found by
+        bisecting the boundaries instead of stepping piece by piece.
+        """
+        size, overlap = self.chunk_size, self.chunk_overlap
+        head = first
+        while True:
+            # First piece i > head that no longer fits alongside the window
+            i = bisect.bisect_right(bounds, bounds[head] + size, head + 2, last + 1) - 1
+            if i >= last:
+                break
+            self._emit(text, bounds[head], bounds[i], spans)
+            # Drop pieces until the window fits in the overlap and leaves room for piece i
+            head = max(
+                bisect.bisect_left(bounds, bounds[i] - overlap, head, i),
+                bisect.bisect_left(bounds, bounds[i + 1] - size, head, i),
+            )
+        if close:
+            self._emit(text, bounds[head], bounds[last], spans)
+        return head
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, spans: "array.array") -> None:
+        """Record text[start:end] with surrounding whitespace stripped, unless nothing is left"""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            spans.extend((start, end))
+
+
+class _SplitStream:
+    """One level of RecursiveTextSplitter._split over text that arrives in fragments.
+
+    Splits on the level's first separator without knowing whether the text
+    contains it: text without it is a single piece, which is one chunk or,
+    when too long, split on the remaining separators, and that is what
+    choosing the next separator up front yields too. ``text`` holds the
+    merge window followed by the piece being read; each fragment's complete
+    pieces go through the splitter's own merging, and a piece that grows to
+    chunk_size is passed on to a stream for the next separator as it
+    arrives, rather than buffered until it ends.
+    """
+
+    def __init__(self, splitter: RecursiveTextSplitter, separators: List[str]):
+        self.splitter = splitter
+        self.separator = separators[0]
+        self.remaining = separators[1:] if self.separator else []
+        self.text = ""
+        self.bounds = [0]  # pieces in the window; the last starts the piece being read
+        self.scanned = 0  # no separator starts before here that is not in bounds
+        self.long = False  # the piece being read is too long and goes to child or overflow
+        self.child: Optional["_SplitStream"] = None
+        self.overflow: List[str] = []  # the long piece, when there is nothing left to split it on
+
+    def feed(self, text: str) -> List[str]:
+        out: List[str] = []
+        self.text += text
+        self._scan(out, final=False)
+        return out
+
+    def close(self) -> List[str]:
+        out: List[str] = []
+        self._scan(out, final=True)
+        return out
+
+    def _scan(self, out: List[str], final: bool) -> None:
+        separator, width = self.separator, len(self.separator)
+        while True:
+            if self.long:
+                found = self.text.find(separator, self.scanned)
+                if found >= 0:
+                    cut = found
+                elif final:
+                    cut = len(self.text)
+                else:
+                    # The tail could be the start of a separator
+                    cut = max(self.scanned, len(self.text) - width + 1)
+                self._pass(self.text[:cut], out)
+                self._drop(cut)
+                if found < 0 and not final:
+                    return
+                self._end_long(out)
+                if found < 0:
+                    return
+                self.bounds, self.scanned = [0], width
+
+            bounds = self.bounds
+            if separator:
+                found = [match.start() for match in self.splitter._patterns[separator].finditer(self.text, self.scanned)]
+                if found:
+                    self.scanned = found[-1] + width
+                    if found[0] == bounds[-1]:
+                        del found[0]  # text that opens with a separator has no empty first piece
+                    bounds.extend(found)
+                self.scanned = max(self.scanned, len(self.text) - width + 1)
+            else:
+                bounds.extend(range(bounds[-1] + 1, len(self.text) + 1))
+            if final and len(self.text) > bounds[-1]:
+                bounds.append(len(self.text))
+
+            spans = array.array("q")
+            head = self.splitter._pieces(self.text, bounds, self.remaining, spans, close=final)
+            out.extend(self.text[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2))
+            if final:
+                return
+            self._drop(bounds[head])
+            self.bounds = [bound - bounds[head] for bound in bounds[head:]]
+            if separator and self.scanned - self.bounds[-1] >= self.splitter.chunk_size:
+                # Too long to merge with anything; split it as it arrives
+                self._end_run(out)
+                self._start_long()
+                continue
+            return
+
+    def _end_run(self, out: List[str]) -> None:
+        """Emit the window as the last chunk of its run and keep only the piece being read"""
+        spans = array.array("q")
+        start = self.bounds[-1]
+        self.splitter._emit(self.text, 0, start, spans)
+        out.extend(self.text[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2))
+        self._drop(start)
+        self.bounds = [0]
+
+    def _start_long(self) -> None:
+        self.long = True
+        if self.remaining:
+            self.child = _SplitStream(self.splitter, self.remaining)
+
+    def _pass(self, text: str, out: List[str]) -> None:
+        if self.child is not None:
+            out.extend(self.child.feed(text))
+        else:
+            self.overflow.append(text)
+
+    def _end_long(self, out: List[str]) -> None:
+        if self.child is not None:
+            out.extend(self.child.close())
+        else:
+            out.append("".join(self.overflow))
+        self.overflow = []
+        self.child = None
+        self.long = False
+
+    def _drop(self, count: int) -> None:
+        if count:
+            self.text = self.text[count:]
+            self.scanned = max(self.scanned - count, 0)
+
+
+class PageText:
+    """Extracted text and metadata of one page, shared by all of its chunks.
+
+    Metadata keys and string values are interned, so the handful of distinct
+    languages, doc types and key names exist once however many pages refer
+    to them. ``encoded`` is where the indexer caches the page's serialized
+    shared metadata.
+    """
+    __slots__ = ("text", "metadata", "encoded")
+
+    def __init__(self, text: str, metadata: Dict[str, Any]):
+        self.text = text
+        self.metadata = {
+            sys.intern(key): sys.intern(value) if isinstance(value, str) else value
+            for key, value in metadata.items()
+        }
+        self.encoded: Optional[Tuple[str, bytes]] = None
+
+
+class Chunk:
+    """One chunk of a page, held as offsets into the page text.
+
+    Quacks like a langchain Document (``page_content``, ``metadata``) so the
+    state store, indexer and dead-letter queue accept either; ``to_document``
+    materializes a real one for callers outside the pipeline. ``text`` holds
+    a copy only when the chunk cannot be located in the page text, as for
+    chunks reloaded from the state store.
+    """
+    __slots__ = ("page", "index", "start", "end", "text", "id")
+
+    def __init__(
+        self,
+        page: PageText,
+        index: Optional[int],
+        start: int = 0,
+        end: int = 0,
+        text: Optional[str] = None,
+        id: Optional[str] = None,
+    ):
+        self.page = page
+        self.index = index
+        self.start = start
+        self.end = end
+        self.text = text
+        self.id = id
+
+    @property
+    def page_content(self) -> str:
+        return self.page.text[self.start:self.end] if self.text is None else self.text
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self.index is None:
+            return dict(self.page.metadata)
+        return {**self.page.metadata, "chunk_index": self.index}
+
+    def to_document(self) -> "Document":
+        """A langchain Document with this chunk's text and metadata; imports langchain"""
+        return require("langchain.schema").Document(page_content=self.page_content, metadata=self.metadata)
+
+
+def chunk_spans(splitter: Any, text: str) -> Tuple["array.array", Dict[int, str]]:
+    """Offsets of each chunk the splitter cuts from text, as flat start/end pairs.
+
+    A splitter with ``split_spans`` reports them directly. For any other
+    the chunks are stripped substrings of the text, so each is found just
+    past the previous one and the substrings themselves can be dropped. A
+    chunk that cannot be found (a splitter that rewrites its input) gets
+    -1/-1 and its text in the returned copies.
+    """
+    copies = {}
+    if hasattr(splitter, "split_spans"):
+        return splitter.split_spans(text), copies
+    spans = array.array("q")
+    cursor = 0
+    for index, piece in enumerate(splitter.split_text(text)):
+        start = text.find(piece, cursor)
+        if start < 0:
+            spans.extend((-1, -1))
+            copies[index] = piece
+            continue
+        spans.extend((start, start + len(piece)))
+        cursor = start
+    return spans, copies
+
+
+def chunks_from_spans(content: PageText, spans: "array.array", copies: Dict[int, str]) -> List[Chunk]:
+    return [
+        Chunk(content, index, text=copies[index]) if spans[2 * index] < 0
+        else Chunk(content, index, spans[2 * index], spans[2 * index + 1])
+        for index in range(len(spans) // 2)
+    ]
+
+
+class CrawlStateStore:
+    """SQLite-backed crawl state that lets an interrupted run be resumed.
+
+    The frontier (with the state of every scheduled page), the chunks produced
+    by fetched pages and the outcome of every index batch are persisted in WAL
+    mode. Each finished page is committed in a single transaction together
+    with the links it discovered, so a resumed run neither re-fetches pages
+    nor re-uploads chunks that already made it to the index.
+
+    The HTTP validator cache outlives individual runs. Validators are only
+    offered to servers once every chunk of the page they describe has been
+    indexed, so a 304 never hides content that did not reach the index.
+
+    The manifest, also kept across runs, maps each page to the chunk IDs that
+    are actually stored in the index. A recrawled page only queues chunks the
+    manifest does not already list, and the chunks it no longer produces are
+    queued in stale_chunks for deletion. Each manifest page also records the
+    seed scope it was crawled under, so a complete crawl only prunes pages of
+    the scopes it was seeded with and leaves other sources' vectors alone.
+    ``is_indexed`` answers "is this chunk already stored?" from a Bloom filter
+    loaded from the manifest, touching SQLite only to confirm the rare
+    positive.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS frontier (
+        key TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        language TEXT NOT NULL,
+        depth INTEGER NOT NULL,
+        scope TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        chunks INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state);
+    CREATE TABLE IF NOT EXISTS chunks (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL,
+        page_key TEXT NOT NULL,
+        language TEXT NOT NULL,
+        text TEXT NOT NULL,
+        metadata TEXT NOT NULL,
+        indexed INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS chunks_pending ON chunks (indexed, seq);
+    CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id);
+    CREATE TABLE IF NOT EXISTS http_cache (
+        key TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        links TEXT NOT NULL,
+        indexed INTEGER NOT NULL DEFAULT 0,
+        fetched_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS manifest (
+        page_key TEXT NOT NULL,
+        chunk_id TEXT NOT NULL,
+        PRIMARY KEY (page_key, chunk_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS manifest_chunk ON manifest (chunk_id);
+    CREATE TABLE IF NOT EXISTS manifest_pages (
+        page_key TEXT PRIMARY KEY,
+        scope TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS stale_chunks (
+        chunk_id TEXT PRIMARY KEY,
+        page_key TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS index_batches (
+        batch INTEGER PRIMARY KEY AUTOINCREMENT,
+        size INTEGER NOT NULL,
+        success INTEGER NOT NULL,
+        error TEXT,
+        finished_at TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path: str = CRAWL_STATE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._bloom: Optional[BloomFilter] = None
+
+    def _load_bloom(self) -> BloomFilter:
+        count = self.conn.execute("SELECT COUNT(*) FROM manifest").fetchone()[0]
+        bloom = BloomFilter(max(2 * count, 100_000))
+        for (chunk_id,) in self.conn.execute("SELECT chunk_id FROM manifest"):
+            bloom.add(chunk_id)
+        return bloom
+
+    def is_indexed(self, chunk_id: str) -> bool:
+        """Whether a chunk with this content-addressed ID is already in the index"""
+        if self._bloom is None:
+            self._bloom = self._load_bloom()
+        if chunk_id not in self._bloom:
+            return False
+        return self.conn.execute(
+            "SELECT 1 FROM manifest WHERE chunk_id = ? LIMIT 1", (chunk_id,)
+        ).fetchone() is not None
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def begin_run(self, resume: bool) -> bool:
+        """Start a run, returning True when an interrupted run is being resumed"""
+        if resume and self._get_meta("run_status") == "running":
+            logger.info(f"Resuming interrupted crawl started at {self._get_meta('run_started_at')}")
+            return True
+        if resume:
+            logger.info("No interrupted crawl to resume, starting a fresh run")
+        with self.conn:
+            self.conn.execute("DELETE FROM frontier")
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("DELETE FROM index_batches")
+            self._set_meta("run_status", "running")
+            self._set_meta("run_started_at", datetime.utcnow().isoformat())
+        return False
+
+    def finish_run(self) -> None:
+        with self.conn:
+            self._set_meta("run_status", "finished")
+            self._set_meta("run_finished_at", datetime.utcnow().isoformat())
+
+    def add_entries(self, entries: Iterable[FrontierEntry]) -> None:
+        with self.conn:
+            self._insert_entries(entries)
+
+    def _insert_entries(self, entries: Iterable[FrontierEntry]) -> None:
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO frontier (key, url, language, depth, scope) VALUES (?, ?, ?, ?, ?)",
+            [(e.key, e.url, e.language, e.depth, e.scope) for e in entries]
+        )
+
+    def seen_keys(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT key FROM frontier")]
+
+    def pending_entries(self) -> List[FrontierEntry]:
+        rows = self.conn.execute(
+            "SELECT url, key, language, depth, scope FROM frontier WHERE state = 'pending' ORDER BY depth"
+        )
+        return [FrontierEntry(*row) for row in rows]
+
+    def cached_page(self, key: str) -> Optional[Tuple[Dict[str, str], List[str]]]:
+        """Conditional request headers and outgoing links for a fully indexed page"""
+        row = self.conn.execute(
+            "SELECT etag, last_modified, links FROM http_cache WHERE key = ? AND indexed = 1",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, links = row
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers, json.loads(links)
+
+    def promote_indexed_pages(self) -> None:
+        """Enable validators for every page whose chunks have all been indexed"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE http_cache SET indexed = 1 WHERE indexed = 0 "
+                "AND key NOT IN (SELECT page_key FROM chunks WHERE indexed = 0)"
+            )
+
+    def complete_page(
+        self,
+        entry: FrontierEntry,
+        chunks: List[Chunk],
+        discovered: List[FrontierEntry],
+        state: str = "done",
+        page: Optional["LoadedPage"] = None,
+    ) -> List[Chunk]:
+        """Atomically record a page's chunks, its discovered links and its final state.
+
+        Returns the chunks that still need to be indexed.
+        """
+        new_chunks = []
+        with self.conn:
+            if page is not None and page.validators:
+                self.conn.execute(
+                    "INSERT INTO http_cache (key, etag, last_modified, links, indexed, fetched_at) "
+                    "VALUES (?, ?, ?, ?, 0, ?) ON CONFLICT(key) DO UPDATE SET "
+                    "etag = excluded.etag, last_modified = excluded.last_modified, "
+                    "links = excluded.links, indexed = 0, fetched_at = excluded.fetched_at",
+                    (
+                        entry.key,
+                        page.validators.get("ETag"),
+                        page.validators.get("Last-Modified"),
+                        json.dumps(page.links),
+                        datetime.utcnow().isoformat(),
+                    )
+                )
+            if state in ("done", "gone"):
+                indexed = {
+                    row[0] for row in
+                    self.conn.execute("SELECT chunk_id FROM manifest WHERE page_key = ?", (entry.key,))
+                }
+                produced = set()
+                rows = []
+                for chunk in chunks:
+                    if chunk.id in produced:
+                        continue
+                    produced.add(chunk.id)
+                    if chunk.id not in indexed:
+                        new_chunks.append(chunk)
+                        rows.append((chunk.id, entry.key, entry.language, chunk.page_content, json.dumps(chunk.metadata)))
+                self.conn.executemany(
+                    "INSERT INTO chunks (id, page_key, language, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO stale_chunks (chunk_id, page_key) VALUES (?, ?)",
+                    [(chunk_id, entry.key) for chunk_id in indexed - produced]
+                )
+            self._insert_entries(discovered)
+            self.conn.execute(
+                "UPDATE frontier SET state = ?, chunks = ? WHERE key = ?",
+                (state, len(chunks), entry.key)
+            )
+        return new_chunks
+
+    def mark_orphans_stale(self) -> int:
+        """Queue deletion of indexed pages this run never reached, returning how many.
+
+        Only pages crawled under one of this run's seed scopes count: the
+        index is shared by every source, and pages of a source this run was
+        not seeded with were simply not asked for. Pages indexed before
+        scopes were recorded are matched by URL instead.
+        """
+        scopes = {row[0] for row in self.conn.execute("SELECT DISTINCT scope FROM frontier")}
+        rows = self.conn.execute(
+            "SELECT DISTINCT manifest.page_key, manifest_pages.scope FROM manifest "
+            "LEFT JOIN manifest_pages USING (page_key) "
+            "WHERE manifest.page_key NOT IN (SELECT key FROM frontier)"
+        ).fetchall()
+        orphans = [
+            (key,) for key, scope in rows
+            if (scope in scopes if scope is not None else any(url_in_scope(key, s) for s in scopes))
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO stale_chunks (chunk_id, page_key) "
+                "SELECT chunk_id, page_key FROM manifest WHERE page_key = ?",
+                orphans
+            )
+        return len(orphans)
+
+    def stale_chunk_ids(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT chunk_id FROM stale_chunks ORDER BY page_key")]
+
+    def record_deletes(self, ids: List[str], success: bool, error: Optional[str] = None) -> None:
+        """Drop deleted chunks from the manifest; failed deletes stay queued for the next run"""
+        if not success:
+            return
+        with self.conn:
+            self.conn.executemany("DELETE FROM manifest WHERE chunk_id = ?", [(i,) for i in ids])
+            self.conn.executemany("DELETE FROM stale_chunks WHERE chunk_id = ?", [(i,) for i in ids])
+            self.conn.execute("DELETE FROM manifest_pages WHERE page_key NOT IN (SELECT page_key FROM manifest)")
+
+    def last_chunk_seq(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM chunks").fetchone()[0]
+
+    def pending_chunks(self, after_seq: int, limit: int, until_seq: Optional[int] = None) -> List[Tuple[int, Chunk]]:
+        """Chunks not yet indexed, in production order, in ``(after_seq, until_seq]``
+
+        Consecutive chunks of a page share one PageText for their metadata.
+        """
+        rows = self.conn.execute(
+            "SELECT seq, id, page_key, text, metadata FROM chunks "
+            "WHERE indexed = 0 AND seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+            (after_seq, until_seq if until_seq is not None else sys.maxsize, limit)
+        )
+        pending = []
+        page, page_key = None, None
+        for seq, chunk_id, key, text, metadata in rows:
+            metadata = json.loads(metadata)
+            index = metadata.pop("chunk_index", None)
+            if page is None or key != page_key or metadata != page.metadata:
+                page, page_key = PageText("", metadata), key
+            pending.append((seq, Chunk(page, index, text=text, id=chunk_id)))
+        return pending
+
+    def record_batch(self, ids: List[str], success: bool, error: Optional[str] = None) -> None:
+        """Persist the outcome of one index batch; successful chunks are never re-uploaded"""
+        with self.conn:
+            if success:
+                self.conn.executemany("UPDATE chunks SET indexed = 1 WHERE id = ?", [(i,) for i in ids])
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO manifest (page_key, chunk_id) SELECT page_key, id FROM chunks WHERE id = ?",
+                    [(i,) for i in ids]
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO manifest_pages (page_key, scope) "
+                    "SELECT key, scope FROM frontier WHERE key IN (SELECT page_key FROM chunks WHERE id = ?)",
+                    [(i,) for i in ids]
+                )
+                if self._bloom is not None:
+                    if self._bloom.count + len(ids) > self._bloom.capacity:
+                        self._bloom = None  # rebuilt at twice the size on next lookup
+                    else:
+                        for chunk_id in ids:
+                            self._bloom.add(chunk_id)
+            self.conn.execute(
+                "INSERT INTO index_batches (size, success, error, finished_at) VALUES (?, ?, ?, ?)",
+                (len(ids), int(success), error, datetime.utcnow().isoformat())
+            )
+
+    def record_replayed(self, pairs: List[Tuple[str, str]]) -> None:
+        """Add replayed chunks, given as (page_key, chunk_id), to the manifest"""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO manifest (page_key, chunk_id) VALUES (?, ?)", pairs)
+            self.conn.executemany("UPDATE chunks SET indexed = 1 WHERE id = ?", [(i,) for _, i in pairs])
+        if self._bloom is not None:
+            for _, chunk_id in pairs:
+                self._bloom.add(chunk_id)
+
+    def chunk_counts(self) -> Dict[str, int]:
+        """Chunks produced this run per language, including ones already indexed"""
+        return dict(self.conn.execute("SELECT language, SUM(chunks) FROM frontier GROUP BY language"))
+
+    def new_chunk_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def page_count(self, state: str = "done") -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM frontier WHERE state = ?", (state,)).fetchone()[0]
+
+
+def _known_codec(name: str) -> bool:
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return False
+    return True
+
+
+@dataclass
+class FetchResult:
+    """Outcome of a single page fetch"""
+    url: str
+    status: int = 0
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and 200 <= self.status < 300
+
+    def header(self, name: str) -> Optional[str]:
+        """Case-insensitive response header lookup"""
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.error is None and self.status == 304
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """ETag / Last-Modified response headers usable for a conditional recrawl"""
+        return {
+            name: self.header(name)
+            for name in ("ETag", "Last-Modified")
+            if self.header(name)
+        }
+
+    @property
+    def encoding(self) -> str:
+        """Charset from the Content-Type header, a BOM or a <meta> tag, defaulting to UTF-8"""
+        content_type = self.header("Content-Type") or ""
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "charset" and value and _known_codec(value.strip('"\'')):
+                return value.strip('"\'')
+        if self.body.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        if self.body.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return "utf-16"
+        if match := META_CHARSET.search(self.body, 0, META_CHARSET_SCAN_BYTES):
+            charset = match.group(1).decode("ascii")
+            if _known_codec(charset):
+                return charset
+        return "utf-8"
+
+    def text(self) -> str:
+        try:
+            return self.body.decode(self.encoding, errors="replace")
+        except LookupError:
+            return self.body.decode("utf-8", errors="replace")
+
+
+class HtmlExtractor:
+    """Turns a fetched page into its main-content text, metadata and links with lxml.
+
+    Text comes from the page's main content element only (chosen per host by
+    MAIN_CONTENT_XPATHS), skipping navigation, scripts and other chrome, with
+    line breaks after block elements so chunks follow the page structure.
+    Links are still collected from the whole page, navigation included.
+    """
+
+    def __init__(self):
+        self.html = require("lxml.html")
+        self.etree = require("lxml.etree")
+
+        def compile_all(paths: List[str]) -> list:
+            return [self.etree.XPath(path) for path in paths]
+        
+        self._main = {host: compile_all(paths) for host, paths in MAIN_CONTENT_XPATHS.items()}
+        self._generic_main = compile_all(GENERIC_MAIN_CONTENT_XPATHS)
+        self._boilerplate = {host: compile_all(paths) for host, paths in BOILERPLATE_XPATHS.items()}
+        self._links = self.etree.XPath("//a/@href", smart_strings=False)
+        self._base = self.etree.XPath("//base/@href", smart_strings=False)
+        self._description = self.etree.XPath("//meta[@name='description']")
+
+    def extract(self, page: FetchResult) -> Tuple[str, Dict[str, str], List[str]]:
+        """Main-content text, WebBaseLoader-style metadata and absolute link targets"""
+        content, metadata, links = self._parse(page)
+        if content is None:
+            return "", metadata, links
+        return EXCESS_NEWLINES.sub("\n\n", "".join(self._fragments(content))).strip(), metadata, links
+
+    def extract_stream(self, page: FetchResult) -> Tuple[Iterator[str], Dict[str, str], List[str]]:
+        """Like extract, with the text as fragments produced while walking the content.
+
+        The decoded page is released once parsed and the tree once the
+        fragments are consumed; the text itself is never assembled.
+        """
+        content, metadata, links = self._parse(page)
+        return (iter(()) if content is None else self._iter_text(content)), metadata, links
+
+    def _parse(self, page: FetchResult) -> Tuple[Any, Dict[str, str], List[str]]:
+        """Main-content element (None if the page does not parse), metadata and links"""
+        metadata = {"source": page.url}
+        text = page.text()
+        if text.startswith("<?xml"):
+            text = text[text.find("?>") + 2:]  # lxml rejects str input with an encoding declaration
+        try:
+            root = self.html.document_fromstring(text)
+        except (self.etree.ParserError, ValueError):
+            return None, metadata, []
+        del text
+
+        title = root.find(".//title")
+        if title is not None:
+            metadata["title"] = title.text_content()
+        if description := self._description(root):
+            metadata["description"] = description[0].get("content", "No description found.")
+        if root.tag == "html":
+            metadata["language"] = root.get("lang", "No language found.")
+
+        base = page.url
+        if base_href := self._base(root):
+            base = urljoin(page.url, base_href[0].strip())
+        links = [urljoin(base, href.strip()) for href in self._links(root)]
+
+        host = (urlsplit(page.url).hostname or "").lower()
+        content = self._main_content(root, host)
+        for path in self._boilerplate.get(host, ()):
+            for element in path(content):
+                element.drop_tree()
+        return content, metadata, links
+
+    def _main_content(self, root, host: str):
+        for path in self._main.get(host, []) + self._generic_main:
+            for element in path(root):
+                if element.text_content().strip():
+                    return element
+        body = root.find("body")
+        return body if body is not None else root
+
+    def _iter_text(self, content) -> Iterator[str]:
+        """What extract returns for an element, as a series of fragments.
+
+        Trailing whitespace of each fragment is held back until more text
+        follows, so newline runs are collapsed whole and the end is stripped.
+        """
+        pending, started = "", False
+        for fragment in self._fragments(content):
+            text = pending + fragment
+            body = text.rstrip()
+            pending = text[len(body):]
+            if not body:
+                continue
+            if not started:
+                body, started = body.lstrip(), True
+            yield EXCESS_NEWLINES.sub("\n\n", body)
+
+    def _fragments(self, content) -> Iterator[str]:
+        """Rendered text of an element, minus boilerplate, with breaks after block elements.
+
+        Whitespace collapses as a browser would render it, except inside <pre>.
+        Parts are yielded in batches of about TEXT_FRAGMENT_CHARS as the walk
+        goes, always keeping the latest back since a following block may
+        still trim it.
+        """
+        parts = []
+        held = 0
+        preformatted = 0
+        # Within an article or main, e.g. Docusaurus' <article><header><h1>
+        sectioned = sum(1 for _ in content.iterancestors(*SECTIONING_TAGS))
+
+        def add(text: str) -> None:
+            nonlocal held
+            if not preformatted:
+                text = WHITESPACE_RUN.sub(" ", text)
+                if not parts or parts[-1].endswith("\n"):
+                    text = text.lstrip(" ")
+            if text:
+                parts.append(text)
+                held += len(text)
+
+        walker = self.etree.iterwalk(content, events=("start", "end"))
+        for event, element in walker:
+            tag = element.tag if isinstance(element.tag, str) else None
+            if event == "start":
+                if tag is None or (tag in BOILERPLATE_TAGS and not (sectioned and tag in SECTION_CHROME_TAGS)):
+                    # Comments and chrome contribute nothing but their tail
+                    walker.skip_subtree()
+                    if element is not content and element.tail:
+                        add(element.tail)
+                    continue
+                if tag in BLOCK_STARTS and parts and not parts[-1].endswith("\n"):
+                    parts[-1] = parts[-1].rstrip(" ")
+                    parts.append("\n")
+                if tag == "pre":
+                    preformatted += 1
+                if tag in SECTIONING_TAGS:
+                    sectioned += 1
+                if element.text:
+                    add(element.text)
+            else:
+                if tag == "pre":
+                    preformatted -= 1
+                if tag in SECTIONING_TAGS:
+                    sectioned -= 1
+                if tag in BLOCK_BREAKS:
+                    if parts and BLOCK_BREAKS[tag] != " ":
+                        parts[-1] = parts[-1].rstrip(" ")
+                    parts.append(BLOCK_BREAKS[tag])
+                if element is not content and element.tail:
+                    add(element.tail)
+                if held > TEXT_FRAGMENT_CHARS:
+                    yield "".join(parts[:-1])
+                    del parts[:-1]
+                    held = len(parts[0])
+        yield "".join(parts)
+
+
+class ParsedPage(NamedTuple):
+    """What a parse worker sends back for one page.
+
+    ``text`` is None when the text was written to the page's shared-memory
+    slot instead, ``text_bytes`` long; chunks are offsets as from chunk_spans.
+    """
+    text: Optional[str]
+    text_bytes: int
+    metadata: Dict[str, str]
+    links: List[str]
+    spans: "array.array"
+    copies: Dict[int, str]
+
+
+# Per-process state of a parse worker, set up by _init_parse_worker
+_parse_worker: Dict[str, Any] = {}
+
+
+def _init_parse_worker(text_splitter: Any, slots: list) -> None:
+    _parse_worker.update(extractor=HtmlExtractor(), splitter=text_splitter, slots=slots)
+
+
+def _parse_in_worker(page: FetchResult, slot: Optional[int], size: int) -> ParsedPage:
+    """Extract and split one page inside a parse worker"""
+    slots = _parse_worker["slots"]
+    if slot is not None and size:
+        page.body = slots[slot][:size]
+    text, metadata, links = _parse_worker["extractor"].extract(page)
+    spans, copies = chunk_spans(_parse_worker["splitter"], text)
+    if slot is not None:
+        encoded = text.encode("utf-8", "surrogatepass")
+        if len(encoded) <= len(slots[slot]):
+            slots[slot][:len(encoded)] = encoded
+            return ParsedPage(None, len(encoded), metadata, links, spans, copies)
+    return ParsedPage(text, 0, metadata, links, spans, copies)
+
+
+class ParsePool:
+    """Runs the extract and split stages in worker processes, off the event loop.
+
+    Where the platform can fork, workers are forked after mapping one
+    anonymous shared-memory slot per worker: a page body is written into a
+    free slot and the extracted text comes back through it, so neither is
+    pickled through a pipe. Bodies or text larger than a slot, and spawned
+    workers, fall back to pickling. Chunks come back as flat offset arrays.
+    Tasks pickle functions by module name, so a crawler loaded from its file
+    must be registered in sys.modules, and spawned workers re-import it,
+    which needs it run as a script.
+
+    Create the pool before the process starts threads or opens sockets and
+    databases: forked workers inherit all of them, and forking while
+    another thread holds a lock can deadlock the child.
+    """
+
+    def __init__(self, workers: int, text_splitter: Any, slot_bytes: int = PARSE_SLOT_BYTES):
+        import mmap
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers
+        self.text_splitter = text_splitter
+        forking = "fork" in multiprocessing.get_all_start_methods()
+        self._slots = [mmap.mmap(-1, slot_bytes) for _ in range(workers)] if forking else []
+        self._free: asyncio.Queue = asyncio.Queue()
+        for slot in range(len(self._slots)):
+            self._free.put_nowait(slot)
+        self._executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("fork" if forking else "spawn"),
+            initializer=_init_parse_worker,
+            initargs=(text_splitter, self._slots),
+        )
+        # Forked executors start every worker on the first submit; do it now,
+        # so they fork from the process as it is while the pool is created
+        self._executor.submit(os.getpid).result()
+
+    async def parse(self, page: FetchResult) -> Tuple[str, Dict[str, str], List[str], "array.array", Dict[int, str]]:
+        """Text, metadata, links and chunk offsets of a fetched page"""
+        loop = asyncio.get_running_loop()
+        slot = await self._free.get() if self._slots else None
+        try:
+            if slot is not None and len(page.body) <= len(self._slots[slot]):
+                self._slots[slot][:len(page.body)] = page.body
+                shipped, size = dataclasses.replace(page, body=b""), len(page.body)
+            else:
+                shipped, size = page, 0
+            result = await loop.run_in_executor(self._executor, _parse_in_worker, shipped, slot, size)
+            text = result.text
+            if text is None:
+                with memoryview(self._slots[slot]) as view:
+                    text = str(view[:result.text_bytes], "utf-8", "surrogatepass")
+        except Exception:
+            self._release(slot)
+            raise
+        # A cancelled parse may still be writing to its slot, so only a finished one frees it
+        self._release(slot)
+        return text, result.metadata, result.links, result.spans, result.copies
+
+    def _release(self, slot: Optional[int]) -> None:
+        if slot is not None:
+            self._free.put_nowait(slot)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for slot in self._slots:
+            slot.close()
+
+
+class AsyncFetcher:
+    """Fetches pages concurrently over a shared keep-alive connection pool.
+
+    A global semaphore bounds the total number of requests in flight and a
+    per-host semaphore keeps any single documentation site from being hammered.
+    Requests wait on the semaphores rather than on the connector so the client
+    timeout only covers actual network time.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = FETCH_CONCURRENCY,
+        per_host: int = FETCH_PER_HOST_CONCURRENCY,
+        timeout: float = FETCH_TIMEOUT,
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._global_limit = asyncio.Semaphore(concurrency)
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        self._ensure_session()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    def _ensure_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            aiohttp = require("aiohttp")
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.per_host,
+                keepalive_timeout=30,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT},
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """Fetch a single URL, never raising for network or HTTP errors"""
+        session = self._ensure_session()
+        aiohttp = require("aiohttp")
+        result = FetchResult(url=url)
+        async with self._global_limit, self._host_limit(url):
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers, allow_redirects=True) as response:
+                    result.status = response.status
+                    result.headers = dict(response.headers)
+                    result.url = str(response.url)
+                    result.body = await response.read()
+                    if response.status >= 400:
+                        result.error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result.error = str(e) or type(e).__name__
+            result.elapsed = time.perf_counter() - started
+        return result
+
+
+class AdaptiveBatchPolicy:
+    """AIMD controller for index batch size.
+
+    Batches are packed up to both a document cap and a payload byte budget.
+    Every batch that succeeds within the target latency grows both limits
+    additively; a slow batch or a content rejection (400/422, or 200 with
+    ``success: false``) halves them. HTTP 413 halves the byte budget only,
+    since it is the payload that was too large. Throttling, 5xx and network
+    errors leave both alone: they say nothing about the batch, and smaller
+    batches would only send more requests to a struggling server, which
+    backoff and Retry-After already pace.
+    """
+
+    def __init__(
+        self,
+        max_docs: int = 10,
+        max_bytes: int = 256 * 1024,
+        target_latency: float = BATCH_TARGET_LATENCY,
+        doc_step: int = 2,
+        byte_step: int = 32 * 1024,
+    ):
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.doc_step = doc_step
+        self.byte_step = byte_step
+        self.increases = 0
+        self.decreases = 0
+
+    def record(self, success: bool, latency: float, status: Optional[int] = None) -> None:
+        """Feed back the outcome of one batch"""
+        if status == 413:
+            self.max_bytes = max(BATCH_MIN_BYTES, self.max_bytes // 2)
+            self.decreases += 1
+        elif (success and latency > self.target_latency) or (not success and status in (200, 400, 422)):
+            self.max_docs = max(BATCH_MIN_DOCS, self.max_docs // 2)
+            self.max_bytes = max(BATCH_MIN_BYTES, self.max_bytes // 2)
+            self.decreases += 1
+        elif success:
+            self.max_docs = min(BATCH_MAX_DOCS, self.max_docs + self.doc_step)
+            self.max_bytes = min(BATCH_MAX_BYTES, self.max_bytes + self.byte_step)
+            self.increases += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "max_docs": self.max_docs,
+            "max_bytes": self.max_bytes,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+def dumps_json(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed"""
+    fast = optional("orjson")
+    if fast is not None:
+        return fast.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def cap_metadata(metadata: Dict[str, Any], max_bytes: int = METADATA_MAX_BYTES) -> Dict[str, Any]:
+    """Shrink metadata to at most max_bytes of JSON by truncating its longest strings"""
+    capped = dict(metadata)
+    excess = len(dumps_json(capped)) - max_bytes
+    while excess > 0:
+        key = max(
+            (k for k, v in capped.items() if isinstance(v, str) and v),
+            key=lambda k: len(capped[k].encode("utf-8")),
+            default=None
+        )
+        if key is None:
+            # Nothing left to trim: drop the largest remaining fields instead
+            key = max(capped, key=lambda k: len(dumps_json(capped[k])))
+            del capped[key]
+        else:
+            value = capped[key]
+            keep = max(0, len(value) - excess - 1)
+            capped[key] = value[:keep] + "…" if keep else ""
+        excess = len(dumps_json(capped)) - max_bytes
+    return capped
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), RETRY_AFTER_CAP)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        delay = (retry_at - datetime.now(retry_at.tzinfo)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+    return min(max(delay, 0.0), RETRY_AFTER_CAP)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given 1-based attempt"""
+    return random.uniform(0, min(UPLOAD_BACKOFF_CAP, UPLOAD_BACKOFF_BASE * (2 ** (attempt - 1))))
+
+
+class EncodedDocument(NamedTuple):
+    """A document queued for upload with its JSON payload serialized once.
+
+    In shared-metadata mode page is the reference into the batch's "shared"
+    table and shared holds that page's encoded metadata.
+    """
+    id: str
+    doc: Union["Document", Chunk]
+    payload: bytes
+    page: Optional[str] = None
+    shared: Optional[bytes] = None
+
+
+@dataclass
+class UploadAttempt:
+    """Outcome of one POST of a batch"""
+    success: bool
+    status: Optional[int] = None
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+
+    @property
+    def retryable(self) -> bool:
+        """Throttling, server errors and network failures are worth retrying"""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+    @property
+    def divisible(self) -> bool:
+        """Whether the server rejected the content in a way a smaller batch might fix.
+
+        Throttling and 5xx say nothing about the content; once their retries
+        run out, splitting would only multiply the requests into an outage.
+        """
+        return self.status in (200, 400, 413, 422)
+
+
+class DeadLetterQueue:
+    """Append-only on-disk store of index batches that could not be uploaded.
+
+    Each failed batch becomes one compact JSON line holding its documents and
+    the last error. With a ``.zst`` path every record is written as its own
+    zstd frame, which keeps appends cheap and the file readable as a single
+    stream. Replaying first claims the file by renaming it, so documents that
+    fail again land in a fresh file and a crashed replay is picked up by the
+    next one.
+    """
+
+    def __init__(self, path: str = DEAD_LETTER_PATH):
+        self.path = path
+        self.compressed = path.endswith(".zst")
+        # Only a .zst path needs zstandard
+        self._zstandard = require("zstandard") if self.compressed else None
+        self.appended = 0
+
+    def append(self, documents: List[Union["Document", Chunk]], error: Optional[str]) -> None:
+        record = json.dumps(
+            {
+                "failed_at": datetime.utcnow().isoformat(),
+                "error": error,
+                "documents": [{"text": doc.page_content, "metadata": doc.metadata} for doc in documents],
+            },
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode("utf-8") + b"\n"
+        if self.compressed:
+            record = self._zstandard.ZstdCompressor().compress(record)
+        with open(self.path, "ab") as f:
+            f.write(record)
+        self.appended += len(documents)
+
+    def claim(self) -> List[str]:
+        """Take ownership of every dead-letter file awaiting replay"""
+        if os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.replaying.{int(time.time() * 1000)}")
+        return sorted(glob.glob(glob.escape(self.path) + ".replaying.*"))
+
+    def read(self, path: str) -> Iterable[Chunk]:
+        """Chunks stored in one dead-letter file, streamed record by record"""
+        with open(path, "rb") as raw:
+            if self.compressed:
+                stream = io.BufferedReader(self._zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True))
+            else:
+                stream = raw
+            for line in stream:
+                if not line.strip():
+                    continue
+                for item in json.loads(line)["documents"]:
+                    metadata = item["metadata"]
+                    index = metadata.pop("chunk_index", None)
+                    yield Chunk(PageText("", metadata), index, text=item["text"])
+
+
+class StageTimings:
+    """Per-stage latency samples for p50/p99 reporting.
+
+    Every duration is counted, but only a uniform reservoir of them is kept
+    so memory stays bounded on million-page crawls.
+    """
+
+    def __init__(self, reservoir: int = STAGE_TIMING_RESERVOIR):
+        self.reservoir = reservoir
+        self.samples: Dict[str, List[float]] = {}
+        self.counts: Dict[str, int] = {}
+        self.totals: Dict[str, float] = {}
+        self._rng = random.Random(0)
+
+    def record(self, stage: str, seconds: float) -> None:
+        count = self.counts.get(stage, 0) + 1
+        self.counts[stage] = count
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+        samples = self.samples.setdefault(stage, [])
+        if len(samples) < self.reservoir:
+            samples.append(seconds)
+        else:
+            slot = self._rng.randrange(count)
+            if slot < self.reservoir:
+                samples[slot] = seconds
+
+    @staticmethod
+    def _percentile(ordered: List[float], fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[stage] = {
+                "count": self.counts[stage],
+                "total_s": round(self.totals[stage], 3),
+                "p50_ms": round(self._percentile(ordered, 0.50) * 1000, 3),
+                "p99_ms": round(self._percentile(ordered, 0.99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return result
+
+
+class Counter:
+    """Monotonic Prometheus counter with optional labels"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket Prometheus histogram with optional labels"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: bucket counts (last one is +Inf), sum
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        if key not in self.values:
+            self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = self.values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels((*self.labelnames, 'le'), (*key, le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Span:
+    """One timed operation in a trace, written out OpenTelemetry-style when it ends"""
+
+    __slots__ = ("telemetry", "name", "trace_id", "span_id", "parent_id", "start_ns", "attributes", "events", "status")
+
+    def __init__(self, telemetry: "Telemetry", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.telemetry = telemetry
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.attributes = attributes
+        self.events: List[Dict[str, Any]] = []
+        self.status = "OK"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes: Any) -> None:
+        self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes})
+
+    def end(self, error: Optional[str] = None) -> None:
+        if error is not None:
+            self.status = "ERROR"
+            self.attributes["error"] = error
+        self.telemetry._export(self, time.time_ns())
+
+
+class StageProfiler:
+    """Sampling CPU profiler, and optional tracemalloc peaks, per pipeline stage.
+
+    A daemon thread samples the event-loop thread's stack every ``interval``
+    seconds and attributes each sample to the innermost pipeline function
+    on it, so interleaved coroutines are still told apart; time the loop
+    spends waiting in select() is reported as "idle". Samples are kept
+    as collapsed stacks rooted at their stage, the input format of
+    flamegraph.pl, inferno and speedscope.
+
+    With ``memory`` every call of a stage that never awaits (extract, split,
+    persist) also records its peak traced memory above what was allocated
+    when it started. tracemalloc's peak is process-wide, so stages that
+    await would share it with whatever runs meanwhile; they are not traced.
+    For the call with the highest peak per stage, the top allocation sites
+    are snapshotted as the call finished, outside the stage's timing.
+    """
+
+    # Innermost matching frame wins, e.g. complete_page inside _finish_page
+    STAGE_FUNCTIONS = {
+        "_fetch_page": "fetch",
+        "fetch": "fetch",
+        "_extract_page": "extract",
+        "_split_page": "split",
+        "_parse_page": "parse",
+        "complete_page": "persist",
+        "_batch_stage": "batch",
+        "_encode_document": "batch",
+        "_upload_batch": "upload",
+        "_encode_body": "upload",
+        "_post_batch": "upload",
+        "delete_documents": "delete",
+        # The event loop waiting on sockets: wall time, not CPU
+        "select": "idle",
+    }
+    # Stages whose calls run to completion without yielding to the event loop
+    MEMORY_STAGES = frozenset({"extract", "split", "persist"})
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, memory: bool = False, top: int = PROFILE_MEMORY_TOP):
+        self.interval = interval
+        self.memory = memory
+        self.top = top
+        self.stacks: Dict[str, int] = {}
+        self.samples: Dict[str, int] = {}
+        self.memory_peaks: Dict[str, Dict[str, Any]] = {}
+        self._labels: Dict[Any, str] = {}
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start sampling the calling thread"""
+        self._target = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="stage-profiler", daemon=True)
+        self._thread.start()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self._sample(frame)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self, frame) -> None:
+        names = []
+        stage = None
+        while frame is not None:
+            code = frame.f_code
+            if stage is None:
+                stage = self.STAGE_FUNCTIONS.get(code.co_name)
+            names.append(self._label(code))
+            frame = frame.f_back
+        stage = stage or "other"
+        names.append(stage)
+        key = ";".join(reversed(names))
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples[stage] = self.samples.get(stage, 0) + 1
+
+    @contextlib.contextmanager
+    def track_memory(self, stage: str):
+        """Record the traced-memory peak of one call of a non-awaiting stage"""
+        if not (self.memory and stage in self.MEMORY_STAGES and tracemalloc.is_tracing()):
+            yield
+            return
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] - before
+            record = self.memory_peaks.setdefault(stage, {"calls": 0, "peak_bytes": 0, "top": []})
+            record["calls"] += 1
+            if peak > record["peak_bytes"]:
+                record["peak_bytes"] = peak
+                record["top"] = [
+                    {"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                    for stat in tracemalloc.take_snapshot().statistics("lineno")[:self.top]
+                ]
+
+    def write(self, directory: str) -> Dict[str, Any]:
+        """Write the collapsed stacks (and memory peaks) next to the stats file"""
+        summary: Dict[str, Any] = {"interval": self.interval, "samples": dict(self.samples)}
+        folded_path = os.path.join(directory, PROFILE_FOLDED_FILE)
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        summary["folded"] = folded_path
+        if self.memory:
+            memory_path = os.path.join(directory, PROFILE_MEMORY_FILE)
+            with open(memory_path, "w", encoding="utf-8") as f:
+                json.dump(self.memory_peaks, f, indent=2)
+            summary["memory"] = memory_path
+            summary["peak_bytes"] = {stage: record["peak_bytes"] for stage, record in self.memory_peaks.items()}
+        return summary
+
+
+class Telemetry:
+    """Metrics and traces for the crawl → index pipeline.
+
+    Stage durations feed the StageTimings used for the run's stats, a
+    Prometheus histogram and, when a trace file is configured, a child span
+    of the page or batch they belong to. Metrics can be scraped from
+    serve_metrics(); spans go to a JSON-lines file, one span per line, using
+    OpenTelemetry field names.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.timings = StageTimings()
+        self.trace_path = trace_path
+        self._trace_file = open(trace_path, "a", encoding="utf-8") if trace_path else None
+        self._metrics_runner = None
+        # Parent of spans started without one, e.g. the whole crawl
+        self.root: Optional[Span] = None
+        # Set by --profile; non-awaiting stage calls then also record memory peaks
+        self.profiler: Optional[StageProfiler] = None
+
+        self.stage_seconds = Histogram("crawler_stage_seconds", "Time spent per pipeline stage", ("stage",))
+        self.fetch_seconds = Histogram("crawler_fetch_seconds", "Page fetch latency", ("host", "status"))
+        self.fetch_bytes = Counter("crawler_fetch_bytes_total", "Response body bytes downloaded", ("host",))
+        self.pages = Counter("crawler_pages_total", "Pages finished, by outcome", ("language", "state"))
+        self.chunks = Counter("crawler_chunks_total", "Chunks produced by the splitter", ("language",))
+        self.upload_seconds = Histogram("crawler_upload_seconds", "Index batch upload latency per attempt", ("status",))
+        self.upload_documents = Histogram("crawler_upload_batch_documents", "Documents per index batch", buckets=BATCH_SIZE_BUCKETS)
+        self.upload_bytes = Histogram("crawler_upload_batch_bytes", "Request body bytes per index batch", buckets=BATCH_BYTES_BUCKETS)
+        self.upload_requests = Counter("crawler_upload_requests_total", "Index batch upload attempts", ("status",))
+        self.search_seconds = Histogram("crawler_search_seconds", "Search request latency", ("status",))
+        self.metrics = [
+            self.stage_seconds, self.fetch_seconds, self.fetch_bytes, self.pages, self.chunks,
+            self.upload_seconds, self.upload_documents, self.upload_bytes, self.upload_requests, self.search_seconds,
+        ]
+
+    @property
+    def tracing(self) -> bool:
+        return self._trace_file is not None
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+        return Span(self, name, parent or self.root, attributes)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, parent: Optional[Span] = None, **attributes: Any):
+        """Time a pipeline stage into the stats, the stage histogram and a child span"""
+        span = self.start_span(name, parent, **attributes) if self.tracing else None
+        memory = self.profiler.track_memory(name) if self.profiler is not None else contextlib.nullcontext()
+        # Outside the timing, so the profiler's snapshots don't count against the stage
+        with memory:
+            started = time.perf_counter()
+            try:
+                yield span
+            finally:
+                elapsed = time.perf_counter() - started
+                self.timings.record(name, elapsed)
+                self.stage_seconds.observe(elapsed, stage=name)
+                if span is not None:
+                    span.end()
+
+    def _export(self, span: Span, end_ns: int) -> None:
+        if self._trace_file is None:
+            return
+        record = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id,
+            "name": span.name,
+            "startTimeUnixNano": span.start_ns,
+            "endTimeUnixNano": end_ns,
+            "attributes": span.attributes,
+            "events": span.events,
+            "status": {"code": span.status},
+        }
+        self._trace_file.write(json.dumps(record, default=str) + "\n")
+
+    def render_metrics(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def serve_metrics(self, port: int, host: str = "127.0.0.1") -> None:
+        """Expose /metrics in Prometheus text format for the rest of the run"""
+        from aiohttp import web
+
+        async def handle(request: "web.Request") -> "web.Response":
+            return web.Response(text=self.render_metrics(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._metrics_runner = web.AppRunner(app, access_log=None)
+        await self._metrics_runner.setup()
+        await web.TCPSite(self._metrics_runner, host, port).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def close(self) -> None:
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+
+@dataclass
+class LoadedPage:
+    """A page moving through the fetch → extract → split stages"""
+    url: str
+    language: str
+    response: Optional[FetchResult] = None
+    content: Optional[PageText] = None
+    chunks: List[Chunk] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+    validators: Dict[str, str] = field(default_factory=dict)
+    not_modified: bool = False
+    failed: bool = False
+    gone: bool = False
+    span: Optional[Span] = None
+
 
 class CloudflareVectorIndexer:
     """Handles indexing documents to Cloudflare Vectorize"""
     
-    def __init__(self, account_id: str, api_token: str, index_name: str):
+    def __init__(
+        self,
+        account_id: str,
+        api_token: str,
+        index_name: str,
+        is_indexed: Optional[Callable[[str], bool]] = None,
+        upload_concurrency: int = UPLOAD_CONCURRENCY,
+        batch_policy: Optional[AdaptiveBatchPolicy] = None,
+        dead_letter: Optional[DeadLetterQueue] = None,
+        compress: bool = UPLOAD_GZIP,
+        shared_metadata: bool = UPLOAD_SHARED_METADATA,
+        telemetry: Optional[Telemetry] = None,
+    ):
         self.account_id = account_id
         self.api_token = api_token
         self.index_name = index_name
         self.workers_url = WORKERS_URL
+        # Lookup of IDs already stored; matching chunks are never re-uploaded
+        self.is_indexed = is_indexed
+        # Batches in flight at once, each on its own pooled keep-alive connection
+        self.upload_concurrency = upload_concurrency
+        self.batch_policy = batch_policy or AdaptiveBatchPolicy()
+        # Where batches that exhaust their retries are kept for replay
+        self.dead_letter = dead_letter
+        self.compress = compress
+        # Upload latency, sizes and statuses, plus a span per batch
+        self.telemetry = telemetry or Telemetry()
+        # Send page metadata once per batch instead of once per chunk
+        self.shared_metadata = shared_metadata
+        self._shared_pages: Dict[str, Tuple[str, bytes]] = {}
+        self._session: Optional["aiohttp.ClientSession"] = None
+    
+    async def __aenter__(self) -> "CloudflareVectorIndexer":
+        self._ensure_session()
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+    
+    def _ensure_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            aiohttp = require("aiohttp")
+            headers = {"Content-Type": "application/json"}
+            if self.api_token:
+                headers["Authorization"] = f"Bearer {self.api_token}"
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.upload_concurrency, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=UPLOAD_TIMEOUT),
+                headers=headers,
+            )
+        return self._session
+    
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
         
     def generate_embedding_id(self, text: str, metadata: Dict) -> str:
-        """Generate a unique ID for an embedding"""
-        content = f"{text}{json.dumps(metadata, sort_keys=True)}"
-        return hashlib.sha256(content.encode()).hexdigest()[:16]
+        """Generate a content-addressed ID for an embedding.
+
+        Only the whitespace-normalized text and the page it came from feed
+        the hash, so cosmetic metadata changes such as a new page title do
+        not force a chunk to be embedded again.
+        """
+        source = metadata.get("source_url") or metadata.get("source", "")
+        identity = normalize_url(source) or source
+        content = " ".join(text.split())
+        return hashlib.sha256(f"{identity}\0{content}".encode()).hexdigest()[:32]
     
-    async def add_documents(self, documents: List[Document]) -> Dict[str, Any]:
-        """Add documents to Vectorize via Workers endpoint"""
+    async def add_documents(
+        self,
+        documents: Union[Iterable["Document"], AsyncIterable["Document"]],
+        on_batch: Optional[Callable[[List[str], bool, Optional[str]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Add documents to Vectorize via Workers endpoint.
+
+        ``documents`` may be a list or an async iterable; batches are uploaded
+        while the iterable is still producing. ``on_batch`` is called after
+        every batch with the batch's document IDs, whether it was stored and
+        the error if it was not. Chunks are taken as well as Documents and
+        keep the ID the crawler already gave them.
+        """
         results = {
             "success": 0,
             "failed": 0,
-            "errors": []
+            "skipped": 0,
+            "batches": 0,
+            "retries": 0,
+            "bisections": 0,
+            "dead_lettered": 0,
+            "bytes_raw": 0,
+            "bytes_sent": 0,
+            "errors": [],
+            "batch_log": []
         }
         
-        # Batch documents for efficient processing
-        batch_size = 10
-        for i in range(0, len(documents), batch_size):
-            batch = documents[i:i + batch_size]
-            
-            # Prepare batch payload
-            batch_documents = []
-            for doc in batch:
-                doc_id = self.generate_embedding_id(doc.page_content, doc.metadata)
-                batch_documents.append({
-                    "id": doc_id,
-                    "text": doc.page_content[:4096],  # Limit text length
-                    "metadata": {
-                        **doc.metadata,
-                        "indexed_at": datetime.utcnow().isoformat(),
-                        "source": "refs_dev_crawler"
-                    }
+        # Batch and upload run as separate stages joined by a bounded queue;
+        # each uploader keeps one batch in flight
+        batches: asyncio.Queue = asyncio.Queue(2 * self.upload_concurrency)
+        uploaders = [
+            asyncio.create_task(self._upload_stage(batches, results, on_batch))
+            for _ in range(self.upload_concurrency)
+        ]
+        
+        async def produce() -> None:
+            await self._batch_stage(documents, batches, results, on_batch)
+            for _ in uploaders:
+                await batches.put(None)
+        
+        stages = [asyncio.create_task(produce()), *uploaders]
+        try:
+            # An uploader that raises stops draining the queue, which would
+            # leave the producer blocked on it; fail the whole call instead
+            done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+        
+        results["batch_policy"] = self.batch_policy.snapshot()
+        
+        return results
+    
+    @staticmethod
+    async def _iterate(documents: Union[Iterable["Document"], AsyncIterable["Document"]]) -> AsyncIterator["Document"]:
+        if hasattr(documents, "__aiter__"):
+            async for doc in documents:
+                yield doc
+        else:
+            for doc in documents:
+                yield doc
+    
+    def _encode_document(self, doc_id: str, doc: Union["Document", Chunk]) -> EncodedDocument:
+        """Serialize one document's entry in the batch body"""
+        if not self.shared_metadata:
+            return EncodedDocument(doc_id, doc, dumps_json({
+                "id": doc_id,
+                "text": doc.page_content[:4096],  # Limit text length
+                "metadata": cap_metadata({
+                    **doc.metadata,
+                    "indexed_at": datetime.utcnow().isoformat(),
+                    "source": "refs_dev_crawler"
                 })
-            
-            # Send to Workers endpoint
-            try:
-                response = requests.post(
-                    f"{self.workers_url}/embeddings/batch",
-                    json={
-                        "documents": batch_documents,
-                        "namespace": "documentation",
-                        "source": "refs_dev_crawler"
-                    },
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_token}" if self.api_token else None
-                    },
-                    timeout=30
-                )
+            }))
+        
+        if isinstance(doc, Chunk):
+            # The page's metadata is encoded once and cached on the page itself
+            if doc.page.encoded is None:
+                doc.page.encoded = self._encode_shared(doc.page.metadata)
+            ref, shared = doc.page.encoded
+            payload = {"id": doc_id, "text": doc.page_content[:4096], "page": ref}
+            if doc.index is not None:
+                payload["chunk"] = doc.index
+            return EncodedDocument(doc_id, doc, dumps_json(payload), ref, shared)
+        
+        page_metadata = {k: v for k, v in doc.metadata.items() if k not in CHUNK_METADATA_KEYS}
+        page_key = json.dumps(page_metadata, sort_keys=True, default=str)
+        if page_key not in self._shared_pages:
+            # Chunks of a page arrive together, so a small cache suffices
+            if len(self._shared_pages) >= 256:
+                self._shared_pages.clear()
+            self._shared_pages[page_key] = self._encode_shared(page_metadata)
+        ref, shared = self._shared_pages[page_key]
+        
+        payload = {"id": doc_id, "text": doc.page_content[:4096], "page": ref}
+        delta = {k: v for k, v in doc.metadata.items() if k in CHUNK_METADATA_KEYS}
+        if "chunk_index" in delta:
+            payload["chunk"] = delta.pop("chunk_index")
+        if delta:
+            payload["metadata"] = delta
+        return EncodedDocument(doc_id, doc, dumps_json(payload), ref, shared)
+    
+    @staticmethod
+    def _encode_shared(page_metadata: Dict[str, Any]) -> Tuple[str, bytes]:
+        """A page's entry in the batch's "shared" table and the reference to it"""
+        # Leave room for the chunk fields the Worker merges back in
+        shared = dumps_json(cap_metadata({
+            **page_metadata,
+            "indexed_at": datetime.utcnow().isoformat(),
+            "source": "refs_dev_crawler"
+        }, METADATA_MAX_BYTES - 64))
+        return hashlib.blake2b(shared, digest_size=8).hexdigest(), shared
+    
+    def _encode_body(self, batch: List[EncodedDocument]) -> Tuple[bytes, Dict[str, str], int]:
+        """Assemble a request body from pre-serialized documents, gzipping it if enabled.
+
+        Returns the body, its extra headers and its uncompressed size.
+        """
+        body = b'{"documents":[' + b",".join(item.payload for item in batch) + b"]"
+        if self.shared_metadata:
+            shared = {item.page: item.shared for item in batch}
+            body += b',"shared":{' + b",".join(
+                b'"' + ref.encode("ascii") + b'":' + metadata for ref, metadata in shared.items()
+            ) + b"}"
+        body += b',"namespace":"documentation","source":"refs_dev_crawler"}'
+        if self.compress and len(body) >= UPLOAD_GZIP_MIN_BYTES:
+            return gzip.compress(body, compresslevel=UPLOAD_GZIP_LEVEL), {"Content-Encoding": "gzip"}, len(body)
+        return body, {}, len(body)
+    
+    @staticmethod
+    def _batch_cost(item: EncodedDocument, batch_pages: set) -> int:
+        """Bytes an item adds to a batch, counting its page metadata only once"""
+        size = len(item.payload) + 1
+        if item.page is not None and item.page not in batch_pages:
+            size += len(item.shared) + len(item.page) + 4
+        return size
+    
+    async def _batch_stage(
+        self,
+        documents: Union[Iterable["Document"], AsyncIterable["Document"]],
+        batches: asyncio.Queue,
+        results: Dict[str, Any],
+        on_batch: Optional[Callable[[List[str], bool, Optional[str]], None]],
+    ) -> None:
+        """Pack incoming documents into batches sized by the adaptive policy.
+
+        A partial batch is flushed when no document arrives for BATCH_LINGER
+        seconds so a slow producer never holds chunks back. Documents that are
+        already indexed are reported to on_batch as successes in groups of
+        BATCH_SKIP_REPORT as they are seen.
+        """
+        policy = self.batch_policy
+        batch = []
+        batch_bytes = 0
+        batch_pages = set()
+        skipped = []
+        iterator = self._iterate(documents).__aiter__()
+        next_doc = asyncio.ensure_future(iterator.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_doc}, timeout=BATCH_LINGER if batch else None)
+                if not done:
+                    await batches.put(batch)
+                    batch, batch_bytes, batch_pages = [], 0, set()
+                    continue
+                try:
+                    doc = next_doc.result()
+                except StopAsyncIteration:
+                    break
+                next_doc = asyncio.ensure_future(iterator.__anext__())
                 
-                if response.status_code == 200:
-                    result = response.json()
+                if isinstance(doc, Chunk) and doc.id:
+                    doc_id = doc.id
+                else:
+                    doc_id = self.generate_embedding_id(doc.page_content, doc.metadata)
+                # Chunks already embedded with identical content never leave the machine
+                if self.is_indexed is not None and self.is_indexed(doc_id):
+                    results["skipped"] += 1
+                    skipped.append(doc_id)
+                    if len(skipped) >= BATCH_SKIP_REPORT:
+                        if on_batch is not None:
+                            on_batch(skipped, True, None)
+                        skipped = []
+                    continue
+                
+                # Serialized once here; the exact size drives the byte budget
+                item = self._encode_document(doc_id, doc)
+                size = self._batch_cost(item, batch_pages)
+                if batch and (len(batch) >= policy.max_docs or batch_bytes + size > policy.max_bytes):
+                    await batches.put(batch)
+                    batch, batch_bytes, batch_pages = [], 0, set()
+                    size = self._batch_cost(item, batch_pages)
+                batch.append(item)
+                batch_bytes += size
+                if item.page is not None:
+                    batch_pages.add(item.page)
+        finally:
+            next_doc.cancel()
+        if batch:
+            await batches.put(batch)
+        
+        if skipped and on_batch is not None:
+            on_batch(skipped, True, None)
+    
+    async def _upload_stage(
+        self,
+        batches: asyncio.Queue,
+        results: Dict[str, Any],
+        on_batch: Optional[Callable[[List[str], bool, Optional[str]], None]],
+    ) -> None:
+        """Upload batches until the end-of-stream marker arrives"""
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                return
+            await self._upload_batch(batch, results, on_batch)
+    
+    async def _post_batch(self, body: bytes, headers: Dict[str, str]) -> UploadAttempt:
+        """POST one encoded batch to the Workers endpoint once"""
+        try:
+            session = self._ensure_session()
+            async with session.post(
+                f"{self.workers_url}/embeddings/batch",
+                data=body,
+                headers=headers
+            ) as response:
+                if response.status == 200:
+                    result = await response.json(content_type=None)
                     if result.get("success"):
+                        return UploadAttempt(True, response.status)
+                    return UploadAttempt(False, response.status, result.get("error", "Unknown error"))
+                return UploadAttempt(
+                    False,
+                    response.status,
+                    f"HTTP {response.status}: {await response.text()}",
+                    parse_retry_after(response.headers.get("Retry-After"))
+                )
+        except Exception as e:
+            return UploadAttempt(False, None, str(e) or type(e).__name__)
+    
+    async def _upload_batch(
+        self,
+        batch: List[EncodedDocument],
+        results: Dict[str, Any],
+        on_batch: Optional[Callable[[List[str], bool, Optional[str]], None]],
+        parent: Optional[Span] = None,
+    ) -> None:
+        """Upload one batch with retries, bisecting it if it keeps being rejected.
+
+        Throttling, 5xx and network errors are retried with jittered
+        exponential backoff, honouring Retry-After, and a batch that still
+        fails with them is dead-lettered whole. A batch whose content the
+        server rejects (400/413/422, or 200 with ``success: false``) is split
+        in half and each half uploaded on its own until the offending
+        document is isolated, so one bad chunk no longer fails its
+        neighbours. Bodies over the hard byte cap are split the same way
+        without being sent.
+        """
+        started = time.perf_counter()
+        body, headers, raw_size = self._encode_body(batch)
+        telemetry = self.telemetry
+        telemetry.upload_documents.observe(len(batch))
+        telemetry.upload_bytes.observe(len(body))
+        span = telemetry.start_span(
+            "upload_batch", parent, documents=len(batch), bytes=len(body), raw_bytes=raw_size
+        ) if telemetry.tracing else None
+        attempt = None
+        for attempt_number in range(1, UPLOAD_MAX_ATTEMPTS + 1):
+            if len(body) > UPLOAD_MAX_BODY_BYTES:
+                attempt = UploadAttempt(False, 413, f"Request body of {len(body)} bytes exceeds the {UPLOAD_MAX_BODY_BYTES} byte cap")
+                self.batch_policy.record(False, 0.0, 413)
+                break
+            attempt_started = time.perf_counter()
+            with telemetry.stage("upload", span, attempt=attempt_number) as attempt_span:
+                attempt = await self._post_batch(body, headers)
+                if attempt_span is not None:
+                    attempt_span.set(status=attempt.status)
+            attempt_latency = time.perf_counter() - attempt_started
+            status = str(attempt.status or "error")
+            telemetry.upload_seconds.observe(attempt_latency, status=status)
+            telemetry.upload_requests.inc(status=status)
+            results["bytes_raw"] += raw_size
+            results["bytes_sent"] += len(body)
+            self.batch_policy.record(attempt.success, attempt_latency, attempt.status)
+            if attempt.success or not attempt.retryable or attempt_number == UPLOAD_MAX_ATTEMPTS:
+                break
+            delay = attempt.retry_after if attempt.retry_after is not None else backoff_delay(attempt_number)
+            logger.warning(f"Batch of {len(batch)} failed ({attempt.error}), retry {attempt_number} in {delay:.1f}s")
+            results["retries"] += 1
+            if span is not None:
+                span.event("retry", delay=delay, error=attempt.error)
+            await asyncio.sleep(delay)
+        
+        latency = round(time.perf_counter() - started, 3)
+        results["batches"] += 1
+        
+        if not attempt.success and attempt.divisible and len(batch) > 1:
+            results["batch_log"].append({
+                "size": len(batch), "attempts": attempt_number, "latency": latency,
+                "status": attempt.status, "outcome": "bisected"
+            })
+            results["bisections"] += 1
+            logger.warning(f"Batch of {len(batch)} rejected ({attempt.error}), bisecting")
+            if span is not None:
+                span.set(attempts=attempt_number, status=attempt.status, outcome="bisected")
+            middle = len(batch) // 2
+            await self._upload_batch(batch[:middle], results, on_batch, span)
+            await self._upload_batch(batch[middle:], results, on_batch, span)
+            if span is not None:
+                span.end()
+            return
+        
+        results["batch_log"].append({
+            "size": len(batch), "attempts": attempt_number, "latency": latency,
+            "status": attempt.status, "outcome": "stored" if attempt.success else "failed"
+        })
+        if attempt.success:
+            results["success"] += len(batch)
+            logger.info(f"Successfully indexed batch of {len(batch)} documents")
+        else:
+            results["failed"] += len(batch)
+            results["errors"].append(attempt.error)
+            logger.error(f"Failed to index batch: {attempt.error}")
+            if self.dead_letter is not None:
+                self.dead_letter.append([item.doc for item in batch], attempt.error)
+                results["dead_lettered"] += len(batch)
+        if span is not None:
+            span.set(attempts=attempt_number, status=attempt.status, outcome="stored" if attempt.success else "failed")
+            span.end(error=None if attempt.success else attempt.error)
+        
+        if on_batch is not None:
+            on_batch([item.id for item in batch], attempt.success, attempt.error)
+    
+    async def delete_documents(
+        self,
+        ids: List[str],
+        on_batch: Optional[Callable[[List[str], bool, Optional[str]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Delete vectors by ID via the Workers /embeddings/delete endpoint"""
+        results = {
+            "success": 0,
+            "failed": 0,
+            "errors": []
+        }
+        
+        async def delete_batch(batch: List[str]) -> None:
+            error_msg = None
+            try:
+                session = self._ensure_session()
+                async with session.delete(
+                    f"{self.workers_url}/embeddings/delete",
+                    params={"ids": ",".join(batch)}
+                ) as response:
+                    body = await response.text()
+                    if response.status == 200 and json.loads(body).get("success"):
                         results["success"] += len(batch)
-                        logger.info(f"Successfully indexed batch of {len(batch)} documents")
+                        logger.info(f"Deleted {len(batch)} stale vectors")
                     else:
-                        results["failed"] += len(batch)
-                        results["errors"].append(result.get("error", "Unknown error"))
-                else:
-                    results["failed"] += len(batch)
-                    error_msg = f"HTTP {response.status_code}: {response.text}"
-                    results["errors"].append(error_msg)
-                    logger.error(f"Failed to index batch: {error_msg}")
-                    
+                        error_msg = f"HTTP {response.status}: {body}"
             except Exception as e:
+                error_msg = str(e) or type(e).__name__
+            
+            if error_msg is not None:
                 results["failed"] += len(batch)
-                results["errors"].append(str(e))
-                logger.error(f"Exception indexing batch: {e}")
+                results["errors"].append(error_msg)
+                logger.error(f"Failed to delete stale vectors: {error_msg}")
+            if on_batch is not None:
+                on_batch(batch, error_msg is None, error_msg)
+        
+        # The session's connection limit keeps at most upload_concurrency in flight
+        await asyncio.gather(*(
+            delete_batch(ids[i:i + DELETE_BATCH_SIZE])
+            for i in range(0, len(ids), DELETE_BATCH_SIZE)
+        ))
         
         return results
     
     def search(self, query: str, top_k: int = 5) -> List[Dict]:
         """Search for similar documents"""
+        started = time.perf_counter()
+        status = "error"
         try:
-            response = requests.post(
+            code, body = http_request(
                 f"{self.workers_url}/embeddings/search",
-                json={
+                {
                     "query": query,
                     "topK": top_k,
                     "namespace": "documentation"
                 },
-                headers={"Content-Type": "application/json"},
                 timeout=10
             )
+            status = str(code)
             
-            if response.status_code == 200:
-                data = response.json()
+            if code == 200:
+                data = json.loads(body)
                 return data.get("results", [])
             else:
-                logger.error(f"Search failed: HTTP {response.status_code}")
+                logger.error(f"Search failed: HTTP {code}")
                 return []
                 
         except Exception as e:
             logger.error(f"Search exception: {e}")
             return []
+        finally:
+            self.telemetry.search_seconds.observe(time.perf_counter() - started, status=status)
 
 
 class RefsDevCrawler:
     """Crawls and processes documentation from various sources"""
     
-    def __init__(self, indexer: CloudflareVectorIndexer):
+    def __init__(
+        self,
+        indexer: CloudflareVectorIndexer,
+        fetcher: Optional[AsyncFetcher] = None,
+        max_depth: int = CRAWL_MAX_DEPTH,
+        max_pages: int = CRAWL_MAX_PAGES,
+        state: Optional[CrawlStateStore] = None,
+        use_http_cache: bool = True,
+        sources: Optional[Dict[str, List[str]]] = None,
+        telemetry: Optional[Telemetry] = None,
+        text_splitter: Optional[Any] = None,
+        parse_pool: Optional[ParsePool] = None,
+    ):
         self.indexer = indexer
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        # Seed URLs per language; the bundled documentation sites by default
+        self.sources = sources or DOCUMENTATION_SOURCES
+        # Shared with the indexer so one exporter covers the whole pipeline
+        self.telemetry = telemetry or getattr(indexer, "telemetry", None) or Telemetry()
+        self.fetcher = fetcher or AsyncFetcher()
+        self.state = state or CrawlStateStore(":memory:")
+        self.use_http_cache = use_http_cache
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.extractor = HtmlExtractor()
+        # Worker processes for extract + split, owned by the caller; None
+        # runs them on the event loop
+        self.parse_pool = parse_pool
+        # Anything with split_text will do, a langchain splitter included;
+        # the pool's workers split with the one it was created with
+        self.text_splitter = text_splitter or getattr(parse_pool, "text_splitter", None) or RecursiveTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
-            length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
     
-    def load_documentation(self, url: str, language: str) -> List[Document]:
-        """Load and split documentation from a URL"""
-        documents = []
-        
+    async def _fetch_page(self, url: str, language: str, frontier: Optional[CrawlFrontier] = None) -> LoadedPage:
+        """Fetch stage: download a page, or learn from a 304 that it is unchanged"""
+        page = LoadedPage(url=url, language=language)
         try:
             logger.info(f"Loading documentation from: {url}")
             
-            # Use WebBaseLoader for web pages
-            loader = WebBaseLoader(url)
-            raw_docs = loader.load()
+            # Revalidate pages we already indexed instead of downloading them again
+            cached = self.state.cached_page(normalize_url(url)) if self.use_http_cache else None
+            response = await self.fetcher.fetch(url, headers=cached[0] if cached else None)
+            host = urlsplit(url).hostname or ""
+            self.telemetry.fetch_seconds.observe(response.elapsed, host=host, status=str(response.status or "error"))
+            self.telemetry.fetch_bytes.inc(len(response.body), host=host)
+            if response.not_modified and cached:
+                logger.info(f"Unchanged since last crawl: {url}")
+                page.not_modified = True
+                page.links = cached[1]
+                return page
+            if not response.ok:
+                page.gone = response.status in (404, 410)
+                raise RuntimeError(response.error or f"HTTP {response.status}")
             
-            # Split documents into chunks
-            for doc in raw_docs:
-                # Add metadata
-                doc.metadata.update({
-                    "language": language,
-                    "source_url": url,
-                    "doc_type": "reference"
-                })
-                
-                # Split into chunks
-                chunks = self.text_splitter.split_documents([doc])
-                documents.extend(chunks)
-            
-            logger.info(f"Loaded {len(documents)} chunks from {url}")
+            # A redirect may land on a page another worker already fetched
+            if frontier is not None and normalize_url(response.url) != normalize_url(url):
+                if not frontier.mark_seen(response.url):
+                    logger.info(f"Skipping {url}: redirects to already crawled {response.url}")
+                    return page
             
+            page.response = response
+            page.validators = response.validators
         except Exception as e:
             logger.error(f"Failed to load {url}: {e}")
-        
-        return documents
+            page.failed = True
+        return page
+
+    def _extract_page(self, page: LoadedPage) -> None:
+        """Extract stage: turn the raw response into page text and its links"""
+        if page.response is None:
+            return
+        try:
+            text, metadata, page.links = self.extractor.extract(page.response)
+            page.content = self._page_text(page, text, metadata)
+        except Exception as e:
+            logger.error(f"Failed to extract {page.url}: {e}")
+            page.failed = True
+        finally:
+            page.response = None  # release the body as soon as it is parsed
+
+    @staticmethod
+    def _page_text(page: LoadedPage, text: str, metadata: Dict[str, str]) -> PageText:
+        return PageText(text, {
+            **metadata,
+            "language": page.language,
+            "source_url": page.url,
+            "doc_type": "reference"
+        })
+
+    def _chunk_page(self, content: PageText) -> List[Chunk]:
+        """Split page text into chunks that point back into it"""
+        return chunks_from_spans(content, *chunk_spans(self.text_splitter, content.text))
+
+    def _split_page(self, page: LoadedPage) -> None:
+        """Split stage: cut the extracted page text into chunks"""
+        if page.content is None:
+            return
+        try:
+            page.chunks = self._chunk_page(page.content)
+            self.telemetry.chunks.inc(len(page.chunks), language=page.language)
+            logger.info(f"Loaded {len(page.chunks)} chunks from {page.url}")
+        except Exception as e:
+            logger.error(f"Failed to split {page.url}: {e}")
+            page.failed = True
+        finally:
+            page.content = None
+
+    async def _parse_page(self, pool: ParsePool, page: LoadedPage) -> None:
+        """Extract and split stages in one, run by a parse worker"""
+        if page.response is None:
+            return
+        try:
+            text, metadata, page.links, spans, copies = await pool.parse(page.response)
+            page.chunks = chunks_from_spans(self._page_text(page, text, metadata), spans, copies)
+            self.telemetry.chunks.inc(len(page.chunks), language=page.language)
+            logger.info(f"Loaded {len(page.chunks)} chunks from {page.url}")
+        except BrokenExecutor:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to parse {page.url}: {e}")
+            page.failed = True
+        finally:
+            page.response = None
+
+    async def load_documentation(self, url: str, language: str) -> List["Document"]:
+        """Load and split documentation from a single URL without following links.
+
+        A coroutine: ``await`` it. Returns langchain Documents, so this and
+        stream_documentation are the crawler entry points that import
+        langchain.
+        """
+        return [document async for document in self.stream_documentation(url, language)]
+
+    async def stream_documentation(self, url: str, language: str) -> AsyncIterator["Document"]:
+        """Like load_documentation, yielding each chunk as soon as it is split off.
+
+        The extractor's text fragments feed the splitter while it walks the
+        page, so the page text is never assembled and, beyond the parsed
+        tree, about a chunk of text is held at a time however large the
+        page. Splitters without ``iter_split`` get the joined text. The
+        fetcher is opened for the call, unless the caller already holds it
+        open, and closed once the page is downloaded.
+        """
+        require("langchain.schema")  # fail up front rather than at the first chunk
+        async with contextlib.AsyncExitStack() as stack:
+            if not self.fetcher.is_open:
+                await stack.enter_async_context(self.fetcher)
+            page = await self._fetch_page(url, language)
+        if page.response is None:
+            return
+        chunks = 0
+        try:
+            fragments, metadata, _ = self.extractor.extract_stream(page.response)
+            page.response = None  # release the body as soon as it is parsed
+            content = self._page_text(page, "", metadata)
+            if hasattr(self.text_splitter, "iter_split"):
+                pieces = self.text_splitter.iter_split(fragments)
+            else:
+                pieces = iter(self.text_splitter.split_text("".join(fragments)))
+            for piece in pieces:
+                yield Chunk(content, chunks, text=piece).to_document()
+                chunks += 1
+        except Exception as e:
+            logger.error(f"Failed to parse {url}: {e}")
+            return
+        self.telemetry.chunks.inc(chunks, language=language)
+        logger.info(f"Loaded {chunks} chunks from {url}")
+
+    async def _finish_page(
+        self,
+        entry: FrontierEntry,
+        page: LoadedPage,
+        frontier: CrawlFrontier,
+        chunk_queue: asyncio.Queue,
+    ) -> None:
+        """Schedule a page's links, persist it and hand its new chunks to the indexer"""
+        try:
+            discovered = [
+                new_entry
+                for new_entry in (frontier.add(link, entry.language, entry.depth + 1, entry.scope) for link in page.links)
+                if new_entry is not None
+            ]
+            for chunk in page.chunks:
+                chunk.id = self.indexer.generate_embedding_id(chunk.page_content, chunk.page.metadata)
+            chunks = page.chunks
+            if page.gone:
+                state = "gone"
+            elif page.failed:
+                state = "failed"
+            elif page.not_modified:
+                state = "unchanged"
+            else:
+                state = "done"
+            with self.telemetry.stage("persist", page.span):
+                new_chunks = self.state.complete_page(entry, chunks, discovered, state=state, page=page)
+            self.telemetry.pages.inc(language=entry.language, state=state)
+            if page.span is not None:
+                page.span.set(state=state, chunks=len(chunks), new_chunks=len(new_chunks), links=len(discovered))
+                page.span.end(error="failed" if page.failed else None)
+            for chunk in new_chunks:
+                await chunk_queue.put(chunk)
+        finally:
+            frontier.task_done()
+
+    async def _fetch_stage(self, frontier: CrawlFrontier, extract_queue: asyncio.Queue, chunk_queue: asyncio.Queue) -> None:
+        while True:
+            entry = await frontier.get()
+            span = self.telemetry.start_span(
+                "page", url=entry.url, language=entry.language, depth=entry.depth
+            ) if self.telemetry.tracing else None
+            with self.telemetry.stage("fetch", span):
+                page = await self._fetch_page(entry.url, entry.language, frontier)
+            page.span = span
+            if page.response is None:
+                await self._finish_page(entry, page, frontier, chunk_queue)
+            else:
+                await extract_queue.put((entry, page))
+
+    async def _extract_stage(self, extract_queue: asyncio.Queue, split_queue: asyncio.Queue) -> None:
+        while True:
+            entry, page = await extract_queue.get()
+            with self.telemetry.stage("extract", page.span):
+                self._extract_page(page)
+            await split_queue.put((entry, page))
+            # Parsing holds the loop; let fetches and uploads make progress
+            await asyncio.sleep(0)
+
+    async def _parse_stage(self, pool: ParsePool, extract_queue: asyncio.Queue, split_queue: asyncio.Queue) -> None:
+        """Replaces the extract stage when a parse pool is used; one runs per worker"""
+        while True:
+            entry, page = await extract_queue.get()
+            with self.telemetry.stage("parse", page.span):
+                await self._parse_page(pool, page)
+            await split_queue.put((entry, page))
+
+    async def _split_stage(self, frontier: CrawlFrontier, split_queue: asyncio.Queue, chunk_queue: asyncio.Queue) -> None:
+        while True:
+            entry, page = await split_queue.get()
+            with self.telemetry.stage("split", page.span):
+                self._split_page(page)
+            await self._finish_page(entry, page, frontier, chunk_queue)
+
+    async def _chunk_stream(self, chunk_queue: asyncio.Queue, backlog_until: int) -> AsyncIterator[Chunk]:
+        """Chunks left unindexed by an earlier run, then live chunks until the end marker"""
+        cursor = 0
+        while True:
+            rows = self.state.pending_chunks(cursor, INDEX_SLICE_SIZE, until_seq=backlog_until)
+            if not rows:
+                break
+            cursor = rows[-1][0]
+            for _, doc in rows:
+                yield doc
+        while True:
+            doc = await chunk_queue.get()
+            if doc is None:
+                return
+            yield doc
     
-    async def crawl_all_sources(self) -> Dict[str, Any]:
-        """Crawl all documentation sources"""
-        all_documents = []
+    async def crawl_all_sources(self, resume: bool = False) -> Dict[str, Any]:
+        """Crawl all documentation sources breadth-first from their seed URLs.
+
+        Pages stream through fetch → extract → split stages joined by bounded
+        queues, and the indexer batches and uploads chunks while the crawl is
+        still running, so memory stays flat however large the corpus is.
+        With ``resume`` an interrupted run continues from its persisted
+        frontier and only the chunks that were never indexed are uploaded.
+        """
         stats = {
             "languages": {},
             "total_documents": 0,
-            "total_chunks": 0
+            "total_pages": 0,
+            "unchanged_pages": 0,
+            "total_chunks": 0,
+            "new_chunks": 0,
+            "time_to_first_index": None
         }
         
-        for language, urls in DOCUMENTATION_SOURCES.items():
-            language_docs = []
-            
-            for url in urls:
-                docs = self.load_documentation(url, language)
-                language_docs.extend(docs)
-            
-            stats["languages"][language] = len(language_docs)
-            all_documents.extend(language_docs)
-            
-            logger.info(f"Collected {len(language_docs)} chunks for {language}")
-        
-        stats["total_documents"] = len(DOCUMENTATION_SOURCES)
-        stats["total_chunks"] = len(all_documents)
+        crawl_span = None
+        if self.telemetry.tracing:
+            crawl_span = self.telemetry.root = self.telemetry.start_span("crawl", resume=resume)
         
-        # Index all documents
-        if all_documents:
-            logger.info(f"Indexing {len(all_documents)} total chunks...")
-            index_results = await self.indexer.add_documents(all_documents)
-            stats["indexing"] = index_results
+        frontier = CrawlFrontier(max_depth=self.max_depth, max_pages=self.max_pages)
+        if self.state.begin_run(resume):
+            frontier.restore(self.state.seen_keys(), self.state.pending_entries())
+            logger.info(f"Restored frontier with {len(frontier)} pending pages")
         else:
-            logger.warning("No documents to index")
-            stats["indexing"] = {"success": 0, "failed": 0}
+            seeds = [
+                frontier.add_seed(url, language)
+                for language, urls in self.sources.items()
+                for url in urls
+            ]
+            self.state.add_entries(seed for seed in seeds if seed is not None)
+        
+        started = time.perf_counter()
+        
+        def on_batch(ids: List[str], success: bool, error: Optional[str]) -> None:
+            self.state.record_batch(ids, success, error)
+            if success and stats["time_to_first_index"] is None:
+                stats["time_to_first_index"] = round(time.perf_counter() - started, 3)
+        
+        extract_queue: asyncio.Queue = asyncio.Queue(PIPELINE_PAGE_QUEUE)
+        split_queue: asyncio.Queue = asyncio.Queue(PIPELINE_PAGE_QUEUE)
+        chunk_queue: asyncio.Queue = asyncio.Queue(PIPELINE_CHUNK_QUEUE)
+        parse_pool = self.parse_pool
+        
+        async with self.fetcher:
+            indexing = asyncio.create_task(self.indexer.add_documents(
+                self._chunk_stream(chunk_queue, self.state.last_chunk_seq()),
+                on_batch=on_batch
+            ))
+            # Enough fetch workers to keep the fetcher saturated; it enforces the limits
+            stages = [
+                asyncio.create_task(self._fetch_stage(frontier, extract_queue, chunk_queue))
+                for _ in range(self.fetcher.concurrency)
+            ]
+            if parse_pool is None:
+                stages.append(asyncio.create_task(self._extract_stage(extract_queue, split_queue)))
+            else:
+                stages.extend(
+                    asyncio.create_task(self._parse_stage(parse_pool, extract_queue, split_queue))
+                    for _ in range(parse_pool.workers)
+                )
+            stages.append(asyncio.create_task(self._split_stage(frontier, split_queue, chunk_queue)))
+            crawled = asyncio.create_task(frontier.join())
+            try:
+                # Stages only return by raising; surface that instead of hanging
+                done, _ = await asyncio.wait([crawled, indexing, *stages], return_when=asyncio.FIRST_COMPLETED)
+                if crawled not in done:
+                    for task in done:
+                        task.result()
+                    raise RuntimeError("Crawl pipeline stopped before the frontier was exhausted")
+                await chunk_queue.put(None)
+                stats["indexing"] = await indexing
+            finally:
+                crawled.cancel()
+                for task in stages + [indexing]:
+                    task.cancel()
+                await asyncio.gather(*stages, indexing, return_exceptions=True)
+        
+        chunk_counts = self.state.chunk_counts()
+        for language in self.sources:
+            stats["languages"][language] = chunk_counts.get(language, 0)
+            logger.info(f"Collected {stats['languages'][language]} chunks for {language}")
+        
+        stats["total_documents"] = len(self.sources)
+        stats["total_pages"] = self.state.page_count()
+        stats["unchanged_pages"] = self.state.page_count("unchanged")
+        stats["total_chunks"] = sum(chunk_counts.values())
+        stats["new_chunks"] = self.state.new_chunk_count()
+        self.state.promote_indexed_pages()
+        
+        if stats["indexing"]["failed"]:
+            logger.warning(
+                f"{stats['indexing']['failed']} chunks failed to index; "
+                "they stay pending and will be retried by a --resume run"
+            )
+        
+        # A page budget or a failed fetch cuts the crawl off at an arbitrary
+        # point, so pages it did not reach may well still exist; only prune
+        # pages that vanished from a complete crawl of their own seed scope
+        if frontier.scheduled < self.max_pages and not self.state.page_count("failed"):
+            orphans = self.state.mark_orphans_stale()
+            if orphans:
+                logger.info(f"{orphans} previously indexed pages were not reached and will be removed")
+        stale_ids = self.state.stale_chunk_ids()
+        if stale_ids:
+            logger.info(f"Deleting {len(stale_ids)} stale vectors...")
+        stats["deletion"] = await self.indexer.delete_documents(stale_ids, on_batch=self.state.record_deletes)
+        
+        if not stats["indexing"]["failed"]:
+            self.state.finish_run()
         
+        stats["stages"] = self.telemetry.timings.summary()
+        if self.indexer.telemetry is not self.telemetry:
+            stats["stages"].update(self.indexer.telemetry.timings.summary())
+        if crawl_span is not None:
+            crawl_span.set(pages=stats["total_pages"], chunks=stats["total_chunks"], new_chunks=stats["new_chunks"])
+            crawl_span.end()
+            self.telemetry.root = None
         return stats
 
 
@@ -264,8 +3001,162 @@ class RefAIClient:
         ]
 
 
-async def main():
+async def replay_dead_letters(
+    indexer: CloudflareVectorIndexer,
+    dead_letter: DeadLetterQueue,
+    state: Optional[CrawlStateStore] = None,
+) -> Dict[str, Any]:
+    """Re-submit every dead-lettered document without re-crawling.
+
+    Documents go through add_documents, so they are batched, uploaded
+    concurrently and retried like a normal run; any that fail again are
+    dead-lettered afresh. Stored documents are added to the state manifest
+    and claimed files are removed once the replay finishes.
+    """
+    files = dead_letter.claim()
+    if not files:
+        logger.info("Dead-letter queue is empty, nothing to replay")
+        return {"success": 0, "failed": 0, "skipped": 0, "dead_lettered": 0, "errors": [], "files": 0}
+    
+    logger.info(f"Replaying {len(files)} dead-letter file(s)...")
+    page_keys: Dict[str, str] = {}
+    
+    def documents() -> Iterable[Chunk]:
+        for path in files:
+            for doc in dead_letter.read(path):
+                source = doc.metadata.get("source_url", "")
+                page_keys[indexer.generate_embedding_id(doc.page_content, doc.metadata)] = normalize_url(source) or source
+                yield doc
+    
+    def on_batch(ids: List[str], success: bool, error: Optional[str]) -> None:
+        if success and state is not None:
+            state.record_replayed([(page_keys[i], i) for i in ids])
+    
+    results = await indexer.add_documents(documents(), on_batch=on_batch)
+    for path in files:
+        os.remove(path)
+    results["files"] = len(files)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Crawl documentation and index it in Cloudflare Vectorize")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["crawl", "replay"],
+        default="crawl",
+        help="crawl and index documentation (default), or replay dead-lettered batches"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run from the state database instead of starting over"
+    )
+    parser.add_argument(
+        "--state-db",
+        default=CRAWL_STATE_DB,
+        help=f"SQLite file holding the crawl frontier and indexing progress (default: {CRAWL_STATE_DB})"
+    )
+    parser.add_argument(
+        "--upload-concurrency",
+        type=int,
+        default=UPLOAD_CONCURRENCY,
+        help=f"index batches uploaded in parallel over pooled connections (default: {UPLOAD_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=PARSE_WORKERS,
+        help=f"worker processes that extract and split pages, 0 for none (default: {PARSE_WORKERS})"
+    )
+    parser.add_argument(
+        "--gzip-uploads",
+        action="store_true",
+        default=UPLOAD_GZIP,
+        help="send index batches with Content-Encoding: gzip (the Worker must support it)"
+    )
+    parser.add_argument(
+        "--shared-metadata",
+        action="store_true",
+        default=UPLOAD_SHARED_METADATA,
+        help="send page metadata once per batch with per-chunk deltas (the Worker must support it)"
+    )
+    parser.add_argument(
+        "--dead-letter",
+        default=DEAD_LETTER_PATH,
+        help=f"append-only file for batches that could not be indexed (default: {DEAD_LETTER_PATH})"
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        metavar="LANGUAGE=URL",
+        help="crawl this seed instead of the bundled documentation sources (repeatable; needs --state-db)"
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=CRAWL_MAX_DEPTH,
+        help=f"link hops followed from each seed (default: {CRAWL_MAX_DEPTH})"
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=CRAWL_MAX_PAGES,
+        help=f"pages fetched per run at most (default: {CRAWL_MAX_PAGES})"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running"
+    )
+    parser.add_argument(
+        "--trace-file",
+        default=TRACE_PATH,
+        help="append one JSON span per page, stage and index batch to this file"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"sample CPU stacks per pipeline stage into {PROFILE_FOLDED_FILE} next to the stats file"
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help=f"also trace allocations and record the extract, split and persist peaks in {PROFILE_MEMORY_FILE} (slow)"
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=PROFILE_INTERVAL,
+        help=f"seconds between stack samples (default: {PROFILE_INTERVAL})"
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="ignore cached ETag/Last-Modified validators and download every page in full"
+    )
+    args = parser.parse_args(argv)
+    if args.source:
+        if args.state_db == CRAWL_STATE_DB:
+            # Its validators and manifest describe the bundled sources; keep ad hoc crawls apart
+            parser.error(f"--source needs a --state-db other than the default {CRAWL_STATE_DB}")
+        sources: Dict[str, List[str]] = {}
+        for spec in args.source:
+            language, separator, url = spec.partition("=")
+            if not separator or not url:
+                parser.error(f"--source expects LANGUAGE=URL, got {spec!r}")
+            sources.setdefault(language, []).append(url)
+        args.source = sources
+    return args
+
+
+async def main(argv: Optional[List[str]] = None):
     """Main entry point"""
+    args = parse_args(argv)
+    
     print("🚀 MyCodeAssistant Documentation Crawler")
     print("=" * 50)
     
@@ -273,30 +3164,86 @@ async def main():
     if not CLOUDFLARE_API_TOKEN:
         logger.warning("No CLOUDFLARE_API_TOKEN set, using public endpoints only")
     
+    # Forked first, so workers inherit no threads, sockets or database handles
+    parse_pool = None
+    if args.command == "crawl" and args.parse_workers > 0:
+        parse_pool = ParsePool(args.parse_workers, RecursiveTextSplitter())
+    
     # Initialize components
+    state = CrawlStateStore(args.state_db)
+    telemetry = Telemetry(args.trace_file)
     indexer = CloudflareVectorIndexer(
         account_id=CLOUDFLARE_ACCOUNT_ID,
         api_token=CLOUDFLARE_API_TOKEN,
-        index_name=VECTORIZE_INDEX
+        index_name=VECTORIZE_INDEX,
+        is_indexed=state.is_indexed,
+        upload_concurrency=args.upload_concurrency,
+        dead_letter=DeadLetterQueue(args.dead_letter),
+        compress=args.gzip_uploads,
+        shared_metadata=args.shared_metadata,
+        telemetry=telemetry
     )
     
-    crawler = RefsDevCrawler(indexer)
+    if args.command == "replay":
+        print("\n📮 Replaying dead-lettered batches...")
+        try:
+            async with indexer:
+                results = await replay_dead_letters(indexer, indexer.dead_letter, state)
+        finally:
+            state.close()
+            await telemetry.close()
+        print(f"  ✅ Success: {results['success']}")
+        print(f"  ⏭️  Already indexed: {results['skipped']}")
+        print(f"  ❌ Failed again: {results['failed']}")
+        if results["dead_lettered"]:
+            print(f"  📮 Re-queued in {args.dead_letter}")
+        return results
+    
+    crawler = RefsDevCrawler(
+        indexer,
+        max_depth=args.max_depth,
+        max_pages=args.max_pages,
+        state=state,
+        use_http_cache=not args.full_refresh,
+        sources=args.source,
+        parse_pool=parse_pool
+    )
     
     # Test Workers connectivity
     print("\n🔍 Testing Workers connectivity...")
     try:
-        response = requests.get(f"{WORKERS_URL}/health", timeout=5)
-        if response.status_code == 200:
+        code, _ = http_request(f"{WORKERS_URL}/health", timeout=5)
+        if code == 200:
             print("✅ Workers endpoint is accessible")
         else:
-            print(f"⚠️  Workers returned status {response.status_code}")
+            print(f"⚠️  Workers returned status {code}")
     except Exception as e:
         print(f"❌ Cannot reach Workers: {e}")
         print("Continuing anyway...")
     
     # Crawl documentation
     print("\n📚 Starting documentation crawl...")
-    stats = await crawler.crawl_all_sources()
+    if args.metrics_port:
+        await telemetry.serve_metrics(args.metrics_port)
+        print(f"📈 Metrics at http://127.0.0.1:{args.metrics_port}/metrics")
+    stats_file = "crawler_stats.json"
+    if args.profile or args.profile_memory:
+        telemetry.profiler = StageProfiler(interval=args.profile_interval, memory=args.profile_memory)
+        telemetry.profiler.start()
+    try:
+        async with indexer:
+            stats = await crawler.crawl_all_sources(resume=args.resume)
+    except BaseException:
+        await telemetry.close()
+        raise
+    finally:
+        state.close()
+        if parse_pool is not None:
+            parse_pool.close()
+        if telemetry.profiler is not None:
+            telemetry.profiler.stop()
+    if telemetry.profiler is not None:
+        stats["profile"] = telemetry.profiler.write(os.path.dirname(os.path.abspath(stats_file)))
     
     # Display results
     print("\n" + "=" * 50)
@@ -306,17 +3253,33 @@ async def main():
     for language, count in stats["languages"].items():
         print(f"  {language}: {count} chunks")
     
-    print(f"\nTotal chunks: {stats['total_chunks']}")
+    print(f"\nTotal pages: {stats['total_pages']} ({stats['unchanged_pages']} unchanged)")
+    print(f"Total chunks: {stats['total_chunks']} ({stats['new_chunks']} new)")
     
     if "indexing" in stats:
         print(f"\nIndexing results:")
         print(f"  ✅ Success: {stats['indexing']['success']}")
         print(f"  ❌ Failed: {stats['indexing']['failed']}")
+        print(f"  ⏭️  Already indexed: {stats['indexing']['skipped']}")
+        print(f"  🔁 Retries: {stats['indexing']['retries']}, bisected batches: {stats['indexing']['bisections']}")
+        print(f"  📦 Uploaded: {stats['indexing']['bytes_sent'] / 1e6:.2f} MB "
+              f"({stats['indexing']['bytes_raw'] / 1e6:.2f} MB uncompressed)")
         
-        if stats['indexing']['errors']:
+        print(f"  🗑️  Stale vectors deleted: {stats['deletion']['success']}")
+        
+        errors = stats['indexing']['errors'] + stats['deletion']['errors']
+        if errors:
             print(f"\n⚠️  Errors encountered:")
-            for error in stats['indexing']['errors'][:5]:  # Show first 5 errors
+            for error in errors[:5]:  # Show first 5 errors
                 print(f"    - {error}")
+        if stats['indexing']['dead_lettered']:
+            print(f"\n📮 {stats['indexing']['dead_lettered']} documents saved to {args.dead_letter}; "
+                  "re-submit them with: refs-dev-crawler.py replay")
+    
+    if stats.get("stages"):
+        print(f"\n⏱️  Stage latency (p50 / p99):")
+        for stage, timing in stats["stages"].items():
+            print(f"  {stage}: {timing['p50_ms']:.1f} / {timing['p99_ms']:.1f} ms over {timing['count']} calls")
     
     # Test search functionality
     print("\n🔍 Testing search functionality...")
@@ -339,21 +3302,28 @@ async def main():
     print("\n✅ Documentation crawl complete!")
     
     # Save stats to file for monitoring
-    stats_file = "crawler_stats.json"
     with open(stats_file, "w") as f:
         json.dump({
             "timestamp": datetime.utcnow().isoformat(),
             "stats": stats
         }, f, indent=2)
     print(f"\n📁 Stats saved to {stats_file}")
+    if args.trace_file:
+        print(f"🧵 Spans written to {args.trace_file}")
+    if "profile" in stats:
+        print(f"🔥 CPU profile written to {stats['profile']['folded']} (render with flamegraph.pl or speedscope)")
+        if "memory" in stats["profile"]:
+            print(f"🧠 Per-stage allocation peaks written to {stats['profile']['memory']}")
+    await telemetry.close()
     
     return stats
 
 
 def schedule_daily():
     """Entry point for Cloudflare Workers scheduled job"""
-    # This would be called by a Cloudflare Worker on a schedule
-    asyncio.run(main())
+    # This would be called by a Cloudflare Worker on a schedule; a run that was
+    # killed part way through picks up where it stopped
+    asyncio.run(main(["--resume"]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Synthetic documentation site for crawler scale tests
+Generates a deterministic, interlinked doc site of any size from a seed, with
+realistic page sizes, code blocks and repeated navigation/boilerplate, and
+serves it locally with controllable latency. Pages are rendered on demand, so
+a 1M-page site costs no disk; --output writes a static copy instead.
+
+Crawl it against the Workers stub with a state database of its own, never the
+production index or the default crawler_state.db:
+
+    python Scripts/refs-dev-docsite.py --pages 10000 --port 8788 --latency uniform:0.005,0.05
+    python Scripts/refs-dev-workers-stub.py --port 8787
+    WORKERS_URL=http://127.0.0.1:8787 python Scripts/refs-dev-crawler.py \
+        --state-db synthetic_state.db --source synthetic=http://127.0.0.1:8788/docs/ --max-depth 6
+"""
+
+import os
+import sys
+import math
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+import importlib.util
+from dataclasses import dataclass
+from email.utils import formatdate
+from functools import lru_cache
+from html import escape
+from typing import List, Dict, Optional
+
+try:
+    from aiohttp import web
+except ImportError as e:
+    print(f"Missing required package: {e}")
+    print("Install with: pip install aiohttp")
+    sys.exit(1)
+
+
+# Latency distributions are shared with the Workers stub, a hyphen-named sibling
+_spec = importlib.util.spec_from_file_location(
+    "refs_dev_workers_stub",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "refs-dev-workers-stub.py")
+)
+_stub = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_stub)
+LatencyModel = _stub.LatencyModel
+
+logger = logging.getLogger(__name__)
+
+# Defaults
+DOCSITE_HOST = os.getenv("DOCSITE_HOST", "127.0.0.1")
+DOCSITE_PORT = int(os.getenv("DOCSITE_PORT", "8788"))
+# Fixed so Last-Modified is stable across runs
+SITE_EPOCH = 1700000000
+VOCABULARY_SIZE = 4000
+BOILERPLATE_POOL = 32
+
+
+@dataclass
+class SiteConfig:
+    """Shape of the generated site"""
+    pages: int = 10000
+    seed: int = 0
+    # Page body size in bytes: lognormal around the median, clipped
+    median_bytes: int = 12000
+    size_sigma: float = 0.7
+    min_bytes: int = 1000
+    max_bytes: int = 512 * 1024
+    # Child links per page (forming a tree that reaches every page) plus random cross-links
+    fanout: int = 8
+    cross_links: int = 12
+    # Mean code blocks per page
+    code_blocks: float = 3.0
+    # Navigation sidebar entries repeated on every page
+    nav_links: int = 40
+    # Chance that a paragraph is a stock admonition shared across pages
+    duplicate_rate: float = 0.15
+    # Bumping a page's version changes its body and ETag
+    version: int = 0
+
+
+class DocSite:
+    """Deterministic page renderer: page n is a pure function of (config, n)"""
+
+    def __init__(self, config: Optional[SiteConfig] = None):
+        self.config = config or SiteConfig()
+        rng = random.Random(f"vocabulary:{self.config.seed}")
+        syllables = ["ka", "ro", "mi", "tan", "se", "lu", "vor", "pe", "dix", "an", "ol", "chi", "ber", "nu", "ze", "qua"]
+        self.vocabulary = [
+            "".join(rng.choice(syllables) for _ in range(rng.randint(1, 4)))
+            for _ in range(VOCABULARY_SIZE)
+        ]
+        self.identifiers = [word + rng.choice(["", "Handler", "Config", "Error", "Task", "Builder"]) for word in self.vocabulary[:500]]
+        self.boilerplate = [self._sentence_block(rng, 40) for _ in range(BOILERPLATE_POOL)]
+        self.navigation = "".join(
+            f'<li><a href="/docs/page-{n}.html">{escape(self.vocabulary[n % VOCABULARY_SIZE].title())}</a></li>'
+            for n in range(min(self.config.nav_links, self.config.pages))
+        )
+        # Rendering is cheap but pages are re-requested for conditional GETs
+        self.render = lru_cache(maxsize=4096)(self._render)
+
+    def url(self, n: int) -> str:
+        return f"/docs/page-{n}.html"
+
+    def _sentence_block(self, rng: random.Random, words: int) -> str:
+        text = " ".join(rng.choices(self.vocabulary, k=words))
+        return text[:1].upper() + text[1:] + "."
+
+    def _code_block(self, rng: random.Random) -> str:
+        lines = []
+        for _ in range(rng.randint(3, 25)):
+            name, arg = rng.choice(self.identifiers), rng.choice(self.vocabulary)
+            indent = "    " * rng.randint(0, 2)
+            lines.append(f"{indent}let {arg} = {name}({rng.choice(self.vocabulary)}: {rng.randint(0, 999)})")
+        return "<pre><code>" + escape("\n".join(lines)) + "</code></pre>"
+
+    def links(self, n: int) -> List[int]:
+        """Children in the spanning tree first, then deterministic cross-links"""
+        config = self.config
+        first_child = n * config.fanout + 1
+        children = list(range(first_child, min(first_child + config.fanout, config.pages)))
+        rng = random.Random(f"links:{config.seed}:{n}")
+        cross = [rng.randrange(config.pages) for _ in range(config.cross_links)]
+        return children + cross
+
+    def etag(self, n: int) -> str:
+        digest = hashlib.blake2b(f"{self.config.seed}:{self.config.version}:{n}".encode(), digest_size=8)
+        return f'"{digest.hexdigest()}"'
+
+    def last_modified(self, n: int) -> str:
+        return formatdate(SITE_EPOCH + self.config.version * 86400, usegmt=True)
+
+    def _render(self, n: int) -> bytes:
+        config = self.config
+        rng = random.Random(f"page:{config.seed}:{config.version}:{n}")
+        target = int(rng.lognormvariate(math.log(config.median_bytes), config.size_sigma))
+        target = max(config.min_bytes, min(config.max_bytes, target))
+        title = " ".join(rng.choices(self.vocabulary, k=3)).title()
+
+        code_at = {rng.randrange(64) for _ in range(int(rng.expovariate(1 / config.code_blocks)) if config.code_blocks > 0 else 0)}
+        sections, size, index = [], 0, 0
+        while size < target:
+            if index % 6 == 0:
+                block = f"<h2>{escape(' '.join(rng.choices(self.vocabulary, k=rng.randint(2, 5))).title())}</h2>"
+            elif index in code_at:
+                block = self._code_block(rng)
+            elif rng.random() < config.duplicate_rate:
+                block = f'<p class="note">{self.boilerplate[rng.randrange(BOILERPLATE_POOL)]}</p>'
+            else:
+                block = f"<p>{self._sentence_block(rng, rng.randint(20, 120))}</p>"
+            sections.append(block)
+            size += len(block)
+            index += 1
+
+        related = "".join(
+            f'<li><a href="{self.url(link)}">{escape(self.vocabulary[link % VOCABULARY_SIZE].title())}</a></li>'
+            for link in self.links(n)
+        )
+        page = (
+            '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+            f"<title>{escape(title)} | Synthetic Docs</title>"
+            f'<meta name="description" content="Reference for {escape(title)}.">'
+            "</head><body>"
+            f'<header><nav><a href="/docs/">Synthetic Docs</a><ul class="sidebar">{self.navigation}</ul></nav></header>'
+            f"<main><article><h1>{escape(title)}</h1>{''.join(sections)}"
+            f'<section class="related"><h2>See Also</h2><ul>{related}</ul></section></article></main>'
+            "<footer><p>Copyright Synthetic Docs. All rights reserved. "
+            'Terms of Use | Privacy Policy | <a href="/docs/">Documentation home</a></p></footer>'
+            "</body></html>"
+        )
+        return page.encode("utf-8")
+
+    def render_index(self) -> bytes:
+        roots = "".join(
+            f'<li><a href="{self.url(n)}">{escape(self.vocabulary[n % VOCABULARY_SIZE].title())}</a></li>'
+            for n in range(min(self.config.fanout, self.config.pages))
+        )
+        return (
+            '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>Synthetic Docs</title></head>'
+            f"<body><main><h1>Synthetic Docs</h1><ul>{roots}</ul></main></body></html>"
+        ).encode("utf-8")
+
+    def page_number(self, name: str) -> Optional[int]:
+        if not (name.startswith("page-") and name.endswith(".html")):
+            return None
+        try:
+            n = int(name[5:-5])
+        except ValueError:
+            return None
+        return n if 0 <= n < self.config.pages else None
+
+    def write(self, directory: str) -> int:
+        """Write the site as static files; returns the total bytes written"""
+        docs = os.path.join(directory, "docs")
+        os.makedirs(docs, exist_ok=True)
+        total = 0
+        with open(os.path.join(docs, "index.html"), "wb") as f:
+            total += f.write(self.render_index())
+        for n in range(self.config.pages):
+            with open(os.path.join(docs, f"page-{n}.html"), "wb") as f:
+                total += f.write(self._render(n))
+        return total
+
+
+class DocSiteServer:
+    """Serves a DocSite with ETag/Last-Modified support and injected latency"""
+
+    def __init__(self, site: DocSite, latency: Optional[LatencyModel] = None, seed: Optional[int] = None):
+        self.site = site
+        self.latency = latency or LatencyModel()
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, int] = {"requests": 0, "not_modified": 0, "bytes_sent": 0}
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/docs/", self.handle_index)
+        app.router.add_get("/docs/{name}", self.handle_page)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = DOCSITE_HOST, port: int = DOCSITE_PORT) -> str:
+        """Serve in the running event loop and return the site's seed URL"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}/docs/"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _delay(self) -> None:
+        delay = self.latency.sample(self.rng)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def handle_index(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self.stats["requests"] += 1
+        return web.Response(body=self.site.render_index(), content_type="text/html", charset="utf-8")
+
+    async def handle_page(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self.stats["requests"] += 1
+        n = self.site.page_number(request.match_info["name"])
+        if n is None:
+            return web.Response(status=404, text="Not found")
+        headers = {"ETag": self.site.etag(n), "Last-Modified": self.site.last_modified(n)}
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            self.stats["not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+        body = self.site.render(n)
+        self.stats["bytes_sent"] += len(body)
+        return web.Response(body=body, headers=headers, content_type="text/html", charset="utf-8")
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def site_config_from_args(args: argparse.Namespace) -> SiteConfig:
+    return SiteConfig(
+        pages=args.pages,
+        seed=args.seed,
+        median_bytes=args.median_bytes,
+        size_sigma=args.size_sigma,
+        max_bytes=args.max_bytes,
+        fanout=args.fanout,
+        cross_links=args.cross_links,
+        code_blocks=args.code_blocks,
+        nav_links=args.nav_links,
+        duplicate_rate=args.duplicate_rate,
+        version=args.version,
+    )
+
+
+def add_site_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options shaping the generated site, shared with the benchmark"""
+    defaults = SiteConfig()
+    parser.add_argument("--pages", type=int, default=defaults.pages, help="number of pages in the site")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="generator seed; same seed, same site")
+    parser.add_argument("--median-bytes", type=int, default=defaults.median_bytes, help="median page body size")
+    parser.add_argument("--size-sigma", type=float, default=defaults.size_sigma, help="spread of the lognormal page size")
+    parser.add_argument("--max-bytes", type=int, default=defaults.max_bytes, help="largest page body")
+    parser.add_argument("--fanout", type=int, default=defaults.fanout, help="child links per page")
+    parser.add_argument("--cross-links", type=int, default=defaults.cross_links, help="random links per page")
+    parser.add_argument("--code-blocks", type=float, default=defaults.code_blocks, help="mean code blocks per page")
+    parser.add_argument("--nav-links", type=int, default=defaults.nav_links, help="sidebar links repeated on every page")
+    parser.add_argument("--duplicate-rate", type=float, default=defaults.duplicate_rate, help="share of boilerplate paragraphs")
+    parser.add_argument("--version", type=int, default=defaults.version, help="site revision; changes every body and ETag")
+
+
+def depth_for(config: SiteConfig) -> int:
+    """Link hops from the index needed to reach every page through the tree"""
+    fanout = max(config.fanout, 1)
+    depth, last = 1, fanout - 1
+    while last < config.pages - 1:
+        last = last * fanout + fanout
+        depth += 1
+    return depth
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate and serve a synthetic documentation site")
+    add_site_arguments(parser)
+    parser.add_argument("--host", default=DOCSITE_HOST)
+    parser.add_argument("--port", type=int, default=DOCSITE_PORT)
+    parser.add_argument(
+        "--latency",
+        type=LatencyModel.parse,
+        default=LatencyModel(),
+        help="per-request latency, e.g. fixed:0.02, uniform:0.005,0.05, lognormal:0.03,0.6"
+    )
+    parser.add_argument("--output", help="write the site as static files into this directory and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    site = DocSite(site_config_from_args(args))
+    if args.output:
+        total = site.write(args.output)
+        print(f"📝 Wrote {args.pages} pages ({total / 1e6:.1f} MB) to {args.output}")
+        return
+    server = DocSiteServer(site, args.latency, seed=args.seed)
+    print(f"📚 Serving {args.pages} pages at http://{args.host}:{args.port}/docs/ "
+          f"(reachable with --max-depth {depth_for(site.config)})")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the crawler's per-page and per-chunk hot paths
+Times HTML extraction, splitting, embedding-ID hashing, URL normalization and
+payload encoding over a fixed synthetic corpus, reporting ns/op and the
+transient memory each operation allocates, and checks them against a baseline.
+Before timing the splitter it checks that its chunks, split whole or streamed
+in fragments, match langchain's RecursiveCharacterTextSplitter over a parity
+corpus (skipped without langchain):
+
+    python Scripts/refs-dev-microbench.py                   # compare with the baseline
+    python Scripts/refs-dev-microbench.py --update-baseline # after an intended change
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tracemalloc
+import importlib.util
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(SCRIPTS_DIR, "microbench_baseline.json")
+
+# Corpus: fixed so numbers are comparable across commits
+CORPUS_PAGES = 40
+CORPUS_SEED = 7
+
+# Splitter parity: extracted pages plus random texts built from fragments that
+# stress separator handling, checked at the crawler's settings and at sizes
+# small enough that every text goes through merging and overlap
+PARITY_TEXTS = 1000
+PARITY_SEED = 11
+PARITY_FRAGMENTS = ["a", "b", "word ", " ", "  ", "\t", "\n", "\n\n", "\n\n\n", " \n ", "\u00a0", "é", "x" * 50]
+PARITY_CONFIGS = [(1000, 200), (50, 10), (20, 19), (7, 0)]
+
+
+def _load_sibling(filename: str, name: str):
+    """Import a hyphen-named script that lives next to this one"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+crawler = _load_sibling("refs-dev-crawler.py", "refs_dev_crawler")
+docsite = _load_sibling("refs-dev-docsite.py", "refs_dev_docsite")
+logging.getLogger().setLevel(logging.WARNING)
+
+
+class Corpus:
+    """Pages, documents, chunks and links every benchmark draws from"""
+
+    def __init__(self, pages: int = CORPUS_PAGES, seed: int = CORPUS_SEED):
+        site = docsite.DocSite(docsite.SiteConfig(pages=pages, seed=seed))
+        self.responses = [
+            crawler.FetchResult(
+                url=f"https://docs.example.com{site.url(n)}",
+                status=200,
+                headers={"Content-Type": "text/html; charset=utf-8"},
+                body=site.render(n),
+            )
+            for n in range(pages)
+        ]
+        self.crawler = crawler.RefsDevCrawler(indexer=None, fetcher=object())
+        self.indexer = crawler.CloudflareVectorIndexer("benchmark", "", "benchmark")
+        self.shared_indexer = crawler.CloudflareVectorIndexer("benchmark", "", "benchmark", shared_metadata=True)
+
+        self.pages, self.links = [], []
+        for response in self.responses:
+            text, metadata, links = self.crawler.extractor.extract(response)
+            self.pages.append(crawler.PageText(
+                text, {**metadata, "language": "synthetic", "source_url": response.url, "doc_type": "reference"}
+            ))
+            self.links.extend(links)
+        self.fragments = [list(self.crawler.extractor.extract_stream(response)[0]) for response in self.responses]
+        self.chunks = []
+        for page in self.pages:
+            self.chunks.extend(self.crawler._chunk_page(page))
+        self.ids = [self.indexer.generate_embedding_id(c.page_content, c.metadata) for c in self.chunks]
+        self.encoded = [self.indexer._encode_document(i, c) for i, c in zip(self.ids, self.chunks)]
+        self.batches = [self.encoded[i:i + 100] for i in range(0, len(self.encoded), 100)]
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            "pages": len(self.responses),
+            "html_bytes": sum(len(r.body) for r in self.responses),
+            "text_chars": sum(len(p.text) for p in self.pages),
+            "chunks": len(self.chunks),
+            "links": len(self.links),
+        }
+
+
+def benchmarks(corpus: Corpus) -> Dict[str, Tuple[Callable[[Any], Any], List[Any]]]:
+    """Name → (operation, inputs); one call on one input is one op"""
+    indexer, shared, splitter = corpus.indexer, corpus.shared_indexer, corpus.crawler.text_splitter
+    return {
+        "extract_page": (corpus.crawler.extractor.extract, corpus.responses),
+        "split_page": (corpus.crawler._chunk_page, corpus.pages),
+        "split_page_streaming": (lambda fragments: list(splitter.iter_split(fragments)), corpus.fragments),
+        "embedding_id": (lambda c: indexer.generate_embedding_id(c.page_content, c.page.metadata), corpus.chunks),
+        "normalize_url": (crawler.normalize_url, corpus.links),
+        "encode_document": (lambda pair: indexer._encode_document(*pair), list(zip(corpus.ids, corpus.chunks))),
+        "encode_document_shared": (lambda pair: shared._encode_document(*pair), list(zip(corpus.ids, corpus.chunks))),
+        "encode_batch_body": (lambda batch: indexer._encode_body(batch), corpus.batches),
+    }
+
+
+def parity_corpus(corpus: Corpus) -> List[str]:
+    rng = random.Random(PARITY_SEED)
+    texts = [page.text for page in corpus.pages]
+    texts += ["", " ", "\n\n", "   \n\n  ", "z" * 5000, "z " * 3000, "\n".join(["q" * 999] * 5)]
+    for _ in range(PARITY_TEXTS):
+        texts.append("".join(rng.choice(PARITY_FRAGMENTS) for _ in range(rng.randint(1, 200))))
+    return texts
+
+
+def splitter_parity(corpus: Corpus) -> Optional[List[str]]:
+    """Texts and settings where RecursiveTextSplitter disagrees with langchain; None without langchain"""
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        return None
+    separators = corpus.crawler.text_splitter.separators
+    texts = parity_corpus(corpus)
+    rng = random.Random(PARITY_SEED)
+    mismatches = []
+    for size, overlap in PARITY_CONFIGS:
+        reference = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap, separators=separators)
+        splitter = crawler.RecursiveTextSplitter(size, overlap, separators)
+        for n, text in enumerate(texts):
+            expected = reference.split_text(text)
+            if splitter.split_text(text) != expected:
+                mismatches.append(f"text {n} ({len(text)} chars) at chunk_size={size} chunk_overlap={overlap}")
+                continue
+            spans = splitter.split_spans(text)
+            if [text[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2)] != expected:
+                mismatches.append(f"spans of text {n} ({len(text)} chars) at chunk_size={size} chunk_overlap={overlap}")
+                continue
+            # Streamed in fragments cut anywhere, separators included
+            cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 40))))
+            fragments = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+            if list(splitter.iter_split(fragments)) != expected:
+                mismatches.append(f"stream of text {n} ({len(text)} chars) at chunk_size={size} chunk_overlap={overlap}")
+    return mismatches
+
+
+def measure(operation: Callable[[Any], Any], inputs: List[Any], min_time: float, repeats: int) -> Dict[str, float]:
+    """Best-of-repeats ns/op, then peak transient allocation per op under tracemalloc"""
+    loops = 1
+    while True:
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            for item in inputs:
+                operation(item)
+        elapsed = time.perf_counter_ns() - started
+        if elapsed >= min_time * 1e9 / repeats or loops >= 1 << 20:
+            break
+        loops *= 2
+
+    best = None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter_ns()
+            for _ in range(loops):
+                for item in inputs:
+                    operation(item)
+            per_op = (time.perf_counter_ns() - started) / (loops * len(inputs))
+            best = per_op if best is None else min(best, per_op)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Allocation profile: peak traced memory during each op, and blocks still held after it
+    peaks, retained = [], 0
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = operation(item)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            del result
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        for item in inputs:
+            operation(item)
+        gc.collect()
+        retained = sys.getallocatedblocks() - blocks_before
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ns_per_op": round(best, 1),
+        "alloc_peak_bytes_per_op": round(sum(peaks) / len(peaks)),
+        "retained_blocks_per_op": round(retained / len(inputs), 2),
+        "ops": len(inputs),
+    }
+
+
+def check(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Every benchmark that got slower or allocates more than tolerance allows"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("ns_per_op", "alloc_peak_bytes_per_op"):
+            if previous[metric] and (current[metric] - previous[metric]) / previous[metric] > tolerance:
+                regressions.append(
+                    f"{name}.{metric}: {previous[metric]} → {current[metric]} "
+                    f"({(current[metric] - previous[metric]) / previous[metric]:+.0%})"
+                )
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Micro-benchmark the crawler's hot paths")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds spent timing each benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="timed repeats; the fastest is reported")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing (default: 0.25)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--skip-parity", action="store_true", help="don't check the splitter against langchain")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    corpus = Corpus()
+    suite = benchmarks(corpus)
+    unknown = set(args.names) - set(suite)
+    if unknown:
+        print(f"❌ Unknown benchmarks: {', '.join(sorted(unknown))} (have: {', '.join(suite)})")
+        return 2
+    if args.update_baseline and args.names and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            recorded = json.load(f).get("corpus")
+        # Per-op numbers over different corpora don't compare; re-record them all
+        if recorded != corpus.describe():
+            print(f"❌ {args.baseline} was recorded on another corpus ({recorded}); "
+                  "run every benchmark to update it")
+            return 2
+
+    print(f"🔬 Corpus: {corpus.describe()}")
+    if not args.skip_parity and (not args.names or {"split_page", "split_page_streaming"} & set(args.names)):
+        mismatches = splitter_parity(corpus)
+        if mismatches is None:
+            print("⚠️  langchain not installed; skipping splitter parity")
+        elif mismatches:
+            print(f"❌ Splitter differs from langchain on {len(mismatches)} text(s):")
+            for mismatch in mismatches[:20]:
+                print(f"    - {mismatch}")
+            return 1
+        else:
+            print(f"🧪 Splitter matches langchain on {len(parity_corpus(corpus))} texts × {len(PARITY_CONFIGS)} settings")
+    results = {}
+    for name, (operation, inputs) in suite.items():
+        if args.names and name not in args.names:
+            continue
+        results[name] = measure(operation, inputs, args.min_time, args.repeats)
+        print(
+            f"  {name:<24} {results[name]['ns_per_op']:>14,.0f} ns/op "
+            f"{results[name]['alloc_peak_bytes_per_op']:>12,} B/op peak "
+            f"{results[name]['retained_blocks_per_op']:>8} blocks/op retained"
+        )
+
+    report = {
+        "benchmark": "crawler-micro",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "orjson": crawler.optional("orjson") is not None,
+        "corpus": corpus.describe(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            # A partial run only replaces the benchmarks it measured; main()
+            # already refused one on a different corpus
+            report["results"] = {**previous.get("results", {}), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"💾 Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("⚠️  No baseline yet; create one with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = check(results, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ Regressions beyond {args.tolerance:.0%} against {args.baseline}:")
+        for regression in regressions:
+            print(f"    - {regression}")
+        return 1
+    print("✅ No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
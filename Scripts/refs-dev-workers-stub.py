@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Workers embeddings API
+Serves /health and /embeddings/{batch,search,delete} with the JSON contract of
+edge-backend/src/workers/embeddings.ts from an in-memory vector store, with
+injectable latency, throttling, server errors and body-size limits, so the
+crawler can be load-tested and benchmarked offline:
+
+    python Scripts/refs-dev-workers-stub.py --port 8787 --latency lognormal:0.08,0.5 --rate-429 0.02
+    WORKERS_URL=http://127.0.0.1:8787 python Scripts/refs-dev-crawler.py
+"""
+
+import os
+import sys
+import json
+import math
+import zlib
+import random
+import logging
+import asyncio
+import argparse
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    from aiohttp import web
+except ImportError as e:
+    print(f"Missing required package: {e}")
+    print("Install with: pip install aiohttp")
+    sys.exit(1)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Defaults
+STUB_HOST = os.getenv("WORKERS_STUB_HOST", "127.0.0.1")
+STUB_PORT = int(os.getenv("WORKERS_STUB_PORT", "8787"))
+EMBEDDING_DIMENSIONS = 256
+# Cloudflare rejects request bodies over 100 MB on most plans
+DEFAULT_MAX_BODY_BYTES = 100 * 1024 * 1024
+
+
+@dataclass
+class LatencyModel:
+    """A latency distribution in seconds, parsed from "kind:params".
+
+    Supported: "fixed:s", "uniform:lo,hi", "normal:mean,stddev",
+    "lognormal:median,sigma" and "exp:mean". A bare number is fixed.
+    """
+    kind: str = "fixed"
+    params: Tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, raw = spec.partition(":")
+        if not raw:
+            kind, raw = "fixed", kind
+        params = tuple(float(value) for value in raw.split(","))
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if expected.get(kind) != len(params):
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        return cls(kind, params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        elif self.kind == "exp":
+            value = rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        else:
+            value = self.params[0]
+        return max(0.0, value)
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of the stand-in server"""
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    # Extra service time per document in a batch
+    per_document_latency: float = 0.0
+    # Probability that a request is throttled or fails with a 5xx
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    retry_after: Optional[float] = 1.0
+    max_body_bytes: int = DEFAULT_MAX_BODY_BYTES
+    max_documents: Optional[int] = None
+    seed: Optional[int] = None
+
+
+def embed_text(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Deterministic hashed bag-of-words embedding, L2-normalized"""
+    vector = [0.0] * dimensions
+    for token in text.lower().split():
+        bucket = zlib.crc32(token.encode("utf-8"))
+        vector[bucket % dimensions] += 1.0 if bucket & 0x80000000 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class InMemoryVectorStore:
+    """Vectors, texts and metadata kept in a dict, queried by cosine similarity"""
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.vectors: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def upsert(self, doc_id: str, text: str, metadata: Dict[str, Any], namespace: str) -> None:
+        self.vectors[doc_id] = {
+            "values": embed_text(text, self.dimensions),
+            "text": text,
+            "metadata": metadata,
+            "namespace": namespace,
+        }
+
+    def delete(self, ids: List[str]) -> int:
+        return sum(self.vectors.pop(doc_id, None) is not None for doc_id in ids)
+
+    def query(
+        self,
+        text: str,
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[str, float]]:
+        query = embed_text(text, self.dimensions)
+        scored = []
+        for doc_id, record in self.vectors.items():
+            if namespace and record["namespace"] != namespace:
+                continue
+            if metadata_filter and any(record["metadata"].get(k) != v for k, v in metadata_filter.items()):
+                continue
+            score = sum(a * b for a, b in zip(query, record["values"]))
+            scored.append((doc_id, score))
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:top_k]
+
+
+class WorkersStub:
+    """aiohttp application mirroring the embeddings worker's routes"""
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.rng = random.Random(self.config.seed)
+        self.store = InMemoryVectorStore()
+        self.stats: Dict[str, Any] = {
+            "requests": {},
+            "statuses": {},
+            "bytes_received": 0,
+            "documents_received": 0,
+        }
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        # Body limits are enforced by the handlers so they can answer like Workers do
+        app = web.Application(client_max_size=self.config.max_body_bytes * 4 + 1024, middlewares=[self._middleware])
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_post("/embeddings/batch", self.handle_batch)
+        app.router.add_post("/embeddings/search", self.handle_search)
+        app.router.add_delete("/embeddings/delete", self.handle_delete)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = STUB_HOST, port: int = STUB_PORT) -> str:
+        """Serve in the running event loop and return the base URL"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "WorkersStub":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.Response:
+        """Count requests and inject latency, throttling and server errors"""
+        route = request.path
+        self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+        response = await self._inject_fault(request)
+        if response is None:
+            response = await handler(request)
+        status = str(response.status)
+        self.stats["statuses"][status] = self.stats["statuses"].get(status, 0) + 1
+        return response
+
+    async def _inject_fault(self, request: web.Request) -> Optional[web.Response]:
+        if request.path in ("/health", "/stats"):
+            return None
+        await asyncio.sleep(self.config.latency.sample(self.rng))
+        roll = self.rng.random()
+        if roll < self.config.rate_429:
+            headers = {}
+            if self.config.retry_after is not None:
+                # HTTP delta-seconds are whole seconds; round up so clients still wait
+                headers["Retry-After"] = str(math.ceil(self.config.retry_after))
+            return web.json_response({"error": "Too many requests"}, status=429, headers=headers)
+        if roll < self.config.rate_429 + self.config.rate_5xx:
+            status = self.rng.choice((500, 502, 503))
+            return web.json_response({"error": "Internal server error"}, status=status)
+        return None
+
+    @staticmethod
+    def _timestamp() -> str:
+        return datetime.utcnow().isoformat() + "Z"
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "healthy",
+            "service": "embeddings-worker",
+            "timestamp": self._timestamp(),
+            "vectorize": {"available": True},
+            "stub": True,
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        """Stub-only: request counters and store size, for benchmarks"""
+        return web.json_response({**self.stats, "vectors": len(self.store)})
+
+    async def handle_batch(self, request: web.Request) -> web.Response:
+        # aiohttp has already undone Content-Encoding: gzip at this point
+        body = await request.read()
+        wire_size = request.content_length or len(body)
+        self.stats["bytes_received"] += wire_size
+        if max(wire_size, len(body)) > self.config.max_body_bytes:
+            return web.json_response({"error": "Payload too large"}, status=413)
+
+        try:
+            batch = json.loads(body)
+        except ValueError:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        documents = batch.get("documents") if isinstance(batch, dict) else None
+        if not documents:
+            return web.json_response({"error": "Documents array is required"}, status=400)
+        if self.config.max_documents is not None and len(documents) > self.config.max_documents:
+            return web.json_response({"error": "Too many documents"}, status=413)
+
+        await asyncio.sleep(self.config.per_document_latency * len(documents))
+
+        namespace = batch.get("namespace") or "default"
+        shared_table = batch.get("shared") or {}
+        timestamp = self._timestamp()
+        for doc in documents:
+            # Same merge order as handleBatchEmbedding
+            shared = shared_table.get(doc.get("page")) if doc.get("page") else None
+            metadata = {
+                **(shared or {}),
+                **(doc.get("metadata") or {}),
+                **({"chunk_index": doc["chunk"]} if doc.get("chunk") is not None else {}),
+                "source": batch.get("source") or "langflow",
+                "timestamp": timestamp,
+                "namespace": namespace,
+            }
+            self.store.upsert(doc.get("id") or os.urandom(16).hex(), doc.get("text", ""), metadata, namespace)
+        self.stats["documents_received"] += len(documents)
+
+        return web.json_response({
+            "id": os.urandom(16).hex(),
+            "success": True,
+            "vectorsStored": len(documents),
+            "timestamp": timestamp,
+        })
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        try:
+            search = await request.json()
+        except ValueError:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not search.get("query"):
+            return web.json_response({"error": "Query is required for search"}, status=400)
+
+        matches = self.store.query(
+            search["query"],
+            top_k=search.get("topK") or 10,
+            namespace=search.get("namespace") or "default",
+            metadata_filter=search.get("filter"),
+        )
+        results = []
+        for doc_id, score in matches:
+            record = self.store.vectors[doc_id]
+            results.append({
+                "id": doc_id,
+                "score": score,
+                "metadata": {**record["metadata"], "text": record["text"]},
+            })
+        return web.json_response({"results": results})
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        ids = [doc_id for doc_id in request.query.get("ids", "").split(",") if doc_id]
+        if not ids:
+            return web.json_response({"error": "IDs are required for deletion"}, status=400)
+        self.store.delete(ids)
+        # The worker reports how many IDs it was asked to delete
+        return web.json_response({"success": True, "deleted": len(ids)})
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Workers embeddings API")
+    parser.add_argument("--host", default=STUB_HOST)
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument(
+        "--latency",
+        type=LatencyModel.parse,
+        default=LatencyModel(),
+        help="per-request latency, e.g. fixed:0.05, uniform:0.02,0.2, lognormal:0.08,0.5, exp:0.1"
+    )
+    parser.add_argument("--per-doc-latency", type=float, default=0.0, help="extra seconds per document in a batch")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of requests answered with a 5xx")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s, rounded up to whole seconds")
+    parser.add_argument("--max-body-bytes", type=int, default=DEFAULT_MAX_BODY_BYTES, help="larger batch bodies get a 413")
+    parser.add_argument("--max-docs", type=int, default=None, help="batches with more documents get a 413")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible latency and faults")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    stub = WorkersStub(StubConfig(
+        latency=args.latency,
+        per_document_latency=args.per_doc_latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        retry_after=args.retry_after,
+        max_body_bytes=args.max_body_bytes,
+        max_documents=args.max_docs,
+        seed=args.seed,
+    ))
+    print(f"🧪 Workers stub listening on http://{args.host}:{args.port}")
+    web.run_app(stub.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
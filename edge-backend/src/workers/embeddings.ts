@@ -28,7 +28,12 @@ interface BatchEmbeddingRequest {
     id?: string;
     text: string;
     metadata?: Record<string, any>;
+    // Key into `shared` and the chunk's position within its page
+    page?: string;
+    chunk?: number;
   }>;
+  // Metadata common to every chunk of a page, sent once per batch
+  shared?: Record<string, Record<string, any>>;
   namespace?: string;
   source?: string;
 }
@@ -91,7 +96,7 @@ export default {
     const corsHeaders = {
       'Access-Control-Allow-Origin': '*',
       'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-      'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+      'Access-Control-Allow-Headers': 'Content-Type, Content-Encoding, Authorization',
     };
 
     // Handle preflight requests
@@ -317,6 +322,16 @@ async function handleEmbedding(
   }
 }
 
+// Helper function to parse a JSON body, decoding Content-Encoding: gzip
+async function readJsonBody(request: Request): Promise<any> {
+  const encoding = (request.headers.get('content-encoding') || '').toLowerCase();
+  if (encoding === 'gzip' && request.body) {
+    const decoded = request.body.pipeThrough(new DecompressionStream('gzip'));
+    return new Response(decoded).json();
+  }
+  return request.json();
+}
+
 // Helper function to check if payload is from LangFlow
 function isLangFlowPayload(payload: any): boolean {
   return payload &&
@@ -376,7 +391,7 @@ async function handleBatchEmbedding(
   env: Env,
   corsHeaders: any
 ): Promise<Response> {
-  const requestBody: any = await request.json();
+  const requestBody: any = await readJsonBody(request);
   
   // Check if this is a LangFlow batch webhook request
   const langflowHeaders = extractLangFlowHeaders(request.headers);
@@ -454,9 +469,12 @@ async function handleBatchEmbedding(
 
     for (const doc of batchRequest.documents) {
       const id = doc.id || crypto.randomUUID();
+      const shared = doc.page ? batchRequest.shared?.[doc.page] : undefined;
       
       const metadata = {
+        ...shared,
         ...doc.metadata,
+        ...(doc.chunk !== undefined && { chunk_index: doc.chunk }),
         source: batchRequest.source || 'langflow',
         timestamp: new Date().toISOString(),
         namespace,
@@ -475,7 +493,8 @@ async function handleBatchEmbedding(
         namespace
       });
 
-      // Store in KV
+      // Store in KV, with shared page metadata already merged in: the
+      // request's `shared` table is not kept, so a page reference would dangle
       kvPromises.push(
         env.KV.put(
           `vector:${id}`,